@@ -1,29 +1,49 @@
 import streamlit as st
-import geopandas as gpd
-import folium
 import streamlit.components.v1 as components
-from fpdf import FPDF
 import pandas as pd
 import numpy as np
 import altair as alt
-from datetime import datetime
 import io
+import logging
 import os
+import uuid
+from contextlib import nullcontext
+from underwriting import AFF_TIERS, MIN_DCR, REWARD_TIERS
+from goal_seek import solve
+from sensitivity import DEFAULT_OPEX_SHOCKS, dcr_frontier, grid_frame
+from market_index import MARKET_ALIASES, load_market_index
+from maps import DEFAULT_ZOOM, ZOOM_LEVELS, render_choropleth, render_market_map
+from model_graph import MODEL
+from simulation import DEFAULT_ASSUMPTIONS, POOL_THRESHOLD, simulate_pro_forma, simulation_pool, summarize_simulation
+from reports import DISCLAIMER_TEXT
+from rent_roll import blank_rent_units, read_rent_roll, summarize_rent_roll, unspecified_type_units
+from export_cache import ExportService, export_key
+from deal_store import PAGE_SIZE, SORTS, DealStore
+from telemetry import PROCESS, Rerun, Sampler, SpanStats, is_admin, serve_metrics
 
 # ==========================================
 # 1. PAGE CONFIGURATION & SESSION STATE
 # ==========================================
-st.set_page_config(page_title="MLI Select Pro", layout="wide", page_icon="🏢")
+log = logging.getLogger("mli.app")
 
-if "logged_in" not in st.session_state: st.session_state["logged_in"] = False
-if "accepted_terms" not in st.session_state: st.session_state["accepted_terms"] = False
-if "projects" not in st.session_state: st.session_state["projects"] = {} 
-if "current_project" not in st.session_state: st.session_state["current_project"] = "New Deal 1"
+def init_session():
+    st.set_page_config(page_title="MLI Select Pro", layout="wide", page_icon="🏢")
+    if "logged_in" not in st.session_state: st.session_state["logged_in"] = False
+    if "accepted_terms" not in st.session_state: st.session_state["accepted_terms"] = False
+    if "current_project" not in st.session_state: st.session_state["current_project"] = "New Deal 1"
+    if "export_jobs" not in st.session_state: st.session_state["export_jobs"] = {}
+    if "deal_inputs" not in st.session_state: st.session_state["deal_inputs"] = {}
+    if "deal_version" not in st.session_state: st.session_state["deal_version"] = 0
+    if "model_memo" not in st.session_state: st.session_state["model_memo"] = {}
+    if "username" not in st.session_state: st.session_state["username"] = ""
+    if "admin" not in st.session_state: st.session_state["admin"] = False
+    if "session_id" not in st.session_state: st.session_state["session_id"] = uuid.uuid4().hex
+    if "telemetry" not in st.session_state: st.session_state["telemetry"] = SpanStats()
 
 # ==========================================
 # 2. PROFESSIONAL STYLING (CSS)
 # ==========================================
-st.markdown("""
+APP_CSS = """
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
     
@@ -56,27 +76,193 @@ st.markdown("""
     /* FOOTER */
     .footer { position: fixed; bottom: 0; width: 100%; text-align: center; font-size: 11px; color: #94A3B8; padding: 15px; background: white; border-top: 1px solid #E2E8F0; z-index: 999; }
 </style>
-""", unsafe_allow_html=True)
+"""
 
 # ==========================================
 # 3. HELPERS & CALCULATORS
 # ==========================================
-DISCLAIMER_TEXT = "LEGAL DISCLAIMER: This model is for educational purposes only. Users must verify all CMHC criteria, rent caps, and underwriting assumptions with a qualified lender."
+@st.cache_resource
+def _market_index():
+    # One compiled index per server process, shared read-only by every session
+    return load_market_index()
 
-@st.cache_data
-def load_canada_geo():
-    try: return gpd.read_file("app_data.geojson")
-    except: return None
+def get_market_index():
+    # A failed load is logged and retried on the next rerun instead of being cached as None
+    try: return _market_index()
+    except Exception:
+        log.exception("Market index failed to load; falling back to the default rent cap"); return None
 
-def calculate_cmhc_fee(loan, pts):
-    # CMHC Fee Scale
-    rate = 1.25 if pts >= 100 else (2.25 if pts >= 70 else (3.00 if pts >= 50 else 4.00))
-    return loan * (rate/100), rate
+@st.cache_resource
+def get_simulation_pool():
+    # One warm pool per server process for the large Monte Carlo runs
+    return simulation_pool()
 
-def calculate_pmt(principal, annual_rate, years):
-    r = annual_rate / 100 / 12; n = years * 12
-    if r == 0: return principal / n
-    return principal * (r * (1 + r)**n) / ((1 + r)**n - 1)
+@st.cache_data(max_entries=32, show_spinner=False)
+def run_risk_simulation(data, n_paths, assumptions):
+    sim = simulate_pro_forma(data, n_paths=n_paths, seed=0, assumptions=assumptions, pool=get_simulation_pool() if n_paths > POOL_THRESHOLD else None)
+    return summarize_simulation(sim)
+
+@st.cache_data(max_entries=8, show_spinner="Reading rent roll...")
+def load_rent_roll(payload, name):
+    return read_rent_roll(io.BytesIO(payload), name)
+
+@st.fragment
+def market_map(mkt, cma):
+    # Reruns on its own when the zoom changes; otherwise served from the shared HTML cache
+    zoom = st.select_slider("Map Detail", options=list(ZOOM_LEVELS), value=DEFAULT_ZOOM, format_func=lambda z: {6: "Region", 9: "Metro", 12: "Neighbourhood"}.get(z, str(z)))
+    with span("map_render"): html = render_market_map(mkt, cma, zoom)
+    if html: components.html(html, height=350)
+
+@st.cache_resource
+def get_export_service():
+    return ExportService()
+
+@st.fragment(run_every=0.5)
+def export_progress(job):
+    # Polls while a background export runs, then hands back to a full rerun
+    if job.status in ('queued', 'running'): st.progress(job.progress, text=f"Generating {job.kind.upper()}... ({job.status})")
+    else: st.rerun()
+
+def export_download(kind, label, file_name, current_key):
+    job = st.session_state["export_jobs"].get(kind)
+    if job is None: return
+    if job.key != current_key: st.session_state["export_jobs"].pop(kind); return
+    if job.status in ('queued', 'running'): export_progress(job)
+    elif job.status == 'error': st.error(f"Export failed: {job.error}"); st.session_state["export_jobs"].pop(kind)
+    else:
+        b = get_export_service().result(job)
+        if b is None: st.session_state["export_jobs"].pop(kind); st.warning("Cached export expired. Please generate it again.")
+        else: st.download_button(label, b, file_name=file_name)
+
+@st.cache_resource
+def get_deal_store():
+    return DealStore()
+
+def open_deal(store, name):
+    deal = store.load_deal(name)
+    if deal is None: st.toast(f"'{name}' no longer exists."); return
+    st.session_state["deal_inputs"] = deal['inputs']; st.session_state["deal_version"] += 1
+    st.session_state["current_project"] = deal['name']; st.session_state["export_jobs"] = {}
+
+def export_deals(store):
+    # Deferred: only runs when the download is clicked
+    buf = io.StringIO(); store.export_jsonl(buf); return buf.getvalue()
+
+@st.fragment
+def deal_library(store):
+    with st.expander("🗂️ Deal Library"):
+        q = st.text_input("Search Deals"); c_f1, c_f2 = st.columns(2)
+        f_mkt = c_f1.selectbox("Market", ["All"] + store.markets()); f_score = c_f2.number_input("Min Score", 0, 300, 0, 10)
+        filters = {'search': q or None, 'market': None if f_mkt == "All" else f_mkt, 'min_score': f_score or None}
+        sort = st.selectbox("Sort By", list(SORTS), format_func=str.title)
+        total = store.count_deals(**filters); pages = max((total - 1) // PAGE_SIZE + 1, 1)
+        page = st.number_input(f"Page (of {pages})", 1, pages, 1) - 1 if pages > 1 else 0
+        rows = store.list_deals(page=page, sort=sort, **filters)
+        st.caption(f"{total:,} saved deals")
+        if rows:
+            pick = st.selectbox("Saved Deals", [r['name'] for r in rows], format_func=lambda n: next(f"{n} · {r['score']} pts · {r['dcr']:.2f}x" for r in rows if r['name'] == n))
+            if st.button("📂 Open Deal"): open_deal(store, pick); st.rerun()
+        st.download_button("⬇️ Export All (JSONL)", lambda: export_deals(store), file_name="deals.jsonl", disabled=not total)
+        up = st.file_uploader("Import Deals (JSONL)", type=["jsonl", "json"])
+        if up is not None and st.button("⬆️ Import"):
+            n, rejected = store.import_jsonl(up); st.toast(f"Imported {n:,} deals.")
+            if rejected: st.warning(f"Skipped {len(rejected):,} invalid line(s): " + "; ".join(f"line {i}: {e}" for i, e in rejected[:5]) + (" ..." if len(rejected) > 5 else ""))
+
+@st.fragment
+def sensitivity_panel(grid):
+    # Changing the opex shock only reruns this panel
+    st.markdown('<div class="section-header">Sensitivity Grid</div>', unsafe_allow_html=True)
+    shock = st.select_slider("OpEx Shock (%)", options=[float(o) for o in DEFAULT_OPEX_SHOCKS], value=0.0, help="Across-the-board increase to fixed operating expenses.")
+    with span("charts"): sens = grid_frame(grid); sens = sens[sens['OpEx Shock %'] == shock]
+    # Only real crossings are drawn; vacancies that clear at every grid rate have no line
+    front = dcr_frontier(grid)[shock].rename('Rate').reset_index(); front = front[np.isfinite(front['Rate'])]
+    heat = alt.Chart(sens).mark_rect().encode(x=alt.X('Rate:O', axis=alt.Axis(format='.2f', labelOverlap=True)), y=alt.Y('Vacancy %:O', sort='descending'), color=alt.Color('DCR:Q', scale=alt.Scale(scheme='redyellowgreen', domainMid=1.10)), tooltip=['Rate', 'Vacancy %', 'DCR', 'Status'])
+    edge = alt.Chart(front).mark_line(color='#0F172A', strokeWidth=2, interpolate='step').encode(x='Rate:O', y=alt.Y('Vacancy %:O', sort='descending'))
+    st.altair_chart((heat + edge).properties(height=320), use_container_width=True)
+    st.caption(f"Black line: highest rate that still clears {MIN_DCR:.2f}x DCR at each vacancy; none where every rate on the grid clears ({len(grid['rates'])} rates x {len(grid['vacancies'])} vacancies x {len(grid['opex_shocks'])} opex shocks).")
+
+@st.fragment
+def risk_panel(pdf_data):
+    st.markdown('<div class="section-header">Risk Simulation</div>', unsafe_allow_html=True)
+    if st.toggle("Monte Carlo Risk Mode", help="Simulate rent growth, vacancy, expense inflation and renewal rate across the 10-year hold."):
+        c_s1, c_s2, c_s3, c_s4 = st.columns(4)
+        n_paths = c_s1.select_slider("Paths", options=[10_000, 50_000, 100_000, 500_000], value=50_000, format_func=lambda n: f"{n:,}")
+        g_mu = c_s2.number_input("Rent Growth % (mean / yr)", value=DEFAULT_ASSUMPTIONS['rent_growth'][0], step=0.25)
+        x_mu = c_s3.number_input("Expense Inflation % (mean / yr)", value=DEFAULT_ASSUMPTIONS['expense_inflation'][0], step=0.25)
+        ren_mu = c_s4.number_input("Renewal Rate (mean)", 0.0, 1.0, DEFAULT_ASSUMPTIONS['renewal_rate'][0], 0.05)
+        sim_inputs = {k: float(pdf_data[k]) for k in ('potential_inc', 'vacancy', 'mgmt', 'ex_tax', 'ex_ins', 'ex_util', 'ex_rm', 'ex_res', 'annual_debt_svc')}
+        with span("simulation"): bands, p_breach = run_risk_simulation(sim_inputs, n_paths, {'rent_growth': (g_mu, DEFAULT_ASSUMPTIONS['rent_growth'][1]), 'expense_inflation': (x_mu, DEFAULT_ASSUMPTIONS['expense_inflation'][1]), 'renewal_rate': (ren_mu, DEFAULT_ASSUMPTIONS['renewal_rate'][1])})
+        r1, r2, r3 = st.columns(3)
+        r1.metric(f"P(DCR < {MIN_DCR:.2f}x, Any Year)", f"{p_breach:.1%}"); r2.metric("Year 10 NOI (P50)", f"${bands['NOI P50'].iloc[-1]:,.0f}"); r3.metric("Year 10 DCR (P5)", f"{bands['DCR P5'].iloc[-1]:.2f}x")
+        fan = alt.Chart(bands).mark_area(opacity=0.25, color='#10B981').encode(x='Year:O', y=alt.Y('DCR P5:Q', title='DCR'), y2='DCR P95:Q') + alt.Chart(bands).mark_line(color='#0F172A').encode(x='Year:O', y='DCR P50:Q') + alt.Chart(pd.DataFrame({'y': [MIN_DCR]})).mark_rule(color='#DC3545', strokeDash=[4, 4]).encode(y='y:Q')
+        st.altair_chart(fan.properties(height=260), use_container_width=True)
+        with st.expander("Simulated Bands (P5 / P50 / P95)"): st.dataframe(bands, use_container_width=True, hide_index=True)
+
+@st.fragment
+def screening_panel(mkt, rent_roll, pdf_data, alias_map):
+    st.markdown('<div class="section-header">Market Screening</div>', unsafe_allow_html=True)
+    if st.toggle("Screen All Markets", help="Underwrite this deal template against every CMA rent cap at once."):
+        g = MODEL.run(st.session_state["model_memo"]); g.set(market_index=mkt, rent_roll=rent_roll, report_data=pdf_data, alias_map=alias_map)
+        with span("screening"): screen = g['market_screen']
+        tiers = screen['Affordability Pts'].value_counts()
+        k1, k2, k3 = st.columns(3); k1.metric("Markets at 100 Pts", int(tiers.get(100, 0))); k2.metric("Markets at 70 Pts", int(tiers.get(70, 0))); k3.metric("Markets at 50 Pts", int(tiers.get(50, 0)))
+        color_by = st.selectbox("Map Colour", ["Total Score", "Affordable %", "Approved Loan", "DCR"])
+        cma_vals = screen[screen['Market'] == screen['CMA']].set_index('CMA')[color_by]
+        with span("map_render"): html = render_choropleth(mkt, cma_vals, color_by)
+        components.html(html, height=420)
+        st.dataframe(screen, use_container_width=True, hide_index=True, column_config={'Rent Cap': st.column_config.NumberColumn(format="$%d"), 'Affordable %': st.column_config.NumberColumn(format="%.1f%%"), 'Approved Loan': st.column_config.NumberColumn(format="$%d"), 'Equity': st.column_config.NumberColumn(format="$%d"), 'DCR': st.column_config.NumberColumn(format="%.2fx"), 'Cash-on-Cash %': st.column_config.NumberColumn(format="%.2f%%")})
+
+@st.fragment
+def goal_seek_panel(pdf_data, aff, ltv):
+    # Inverts the sizing and scoring rules directly instead of dragging sliders
+    st.markdown('<div class="section-header">Goal Seek</div>', unsafe_allow_html=True)
+    c_g1, c_g2 = st.columns(2)
+    target = c_g1.number_input("Target DCR", 1.0, 2.0, MIN_DCR, 0.05, format="%.2f", help="Coverage the solver holds fixed.")
+    budget = c_g2.number_input("Equity Budget ($)", 0, value=int(max(pdf_data['equity'], 0)), step=100_000, help="Cash available; solves the largest project cost it can fund.")
+    deal = {k: pdf_data[k] for k in ('cost_base', 'interest_rate', 'score', 'noi', 'approved_loan', 'fee', 'amort')}
+    with span("goal_seek"): s = solve({**deal, 'ltv': ltv, 'total_res': aff['total_res'], 'aff_count': aff['aff_count']}, target, budget)
+    be = s['break_even_rate']; be_txt = "n/a" if np.isnan(be) else ("> 30%" if np.isinf(be) else f"{be:.2f}%")
+    g1, g2, g3, g4 = st.columns(4)
+    g1.metric("Break-Even Rate", be_txt, delta=f"{s['rate_headroom'] * 100:+.0f} bps" if np.isfinite(be) else None, help=f"Highest rate at which the approved loan still covers {target:.2f}x DCR, e.g. at renewal.")
+    g2.metric("Max Cost (Full Leverage)", f"${s['max_cost']:,.0f}", help="Project cost at which the LTV limit meets the DCR limit.")
+    g3.metric("Max Cost (Equity Budget)", f"${s['max_cost_equity']:,.0f}", help="Largest project cost the equity budget can fund with the sized loan.")
+    g4.metric("Required NOI (Full LTV)", f"${s['required_noi']:,.0f}", delta=f"-${s['noi_gap']:,.0f} gap" if s['noi_gap'] > 0 else "met", delta_color="off", help=f"NOI needed for the full LTV loan to clear {target:.2f}x DCR.")
+    tiers = pd.DataFrame({'Affordability Tier': [f"{pts} Points ({pct}% of units)" for pct, pts in AFF_TIERS],
+                          'Units at or Below Cap': [int(s[f'aff_units_{pts}']) for _, pts in AFF_TIERS], 'Additional Needed': [int(s[f'aff_units_{pts}_needed']) for _, pts in AFF_TIERS]})
+    st.dataframe(tiers, use_container_width=True, hide_index=True)
+    st.caption(f"{aff['aff_count']:,.0f} of {aff['total_res']:,} residential units are at or below the rent cap today.")
+
+def recompute_trace(trace):
+    with st.expander("🔧 Recompute Trace", expanded=True):
+        df = pd.DataFrame(trace)
+        if df.empty: st.caption("No model stages ran."); return
+        st.caption(f"{(df['Status'] == 'computed').sum()} of {len(df)} stages recomputed, {(df['Status'] == 'cached').sum()} served from cache ({df['ms'].sum():.1f} ms total).")
+        st.dataframe(df, use_container_width=True, hide_index=True, column_config={'ms': st.column_config.NumberColumn("Time (ms)", format="%.2f")})
+
+@st.cache_resource
+def metrics_endpoint():
+    # One /metrics listener per server process (only when MLI_METRICS_PORT is set)
+    try: return serve_metrics()
+    except OSError: return None
+
+def span(name):
+    # Times a block against the current rerun (no-op before the dashboard starts one)
+    rerun = st.session_state.get("rerun")
+    return rerun.span(name) if rerun is not None else nullcontext()
+
+def admin_panel():
+    with st.expander("🛠️ Admin"):
+        st.button("🔬 Profile Next Rerun", on_click=lambda: st.session_state.update({"profile_next": True}), help="Capture a sampling profile of the next full rerun of this session.")
+        st.caption("Session timings")
+        st.dataframe(pd.DataFrame(st.session_state["telemetry"].table()), use_container_width=True, hide_index=True, column_config={c: st.column_config.NumberColumn(format="%.1f") for c in ('Total (ms)', 'Mean (ms)', 'Max (ms)')})
+        st.download_button("⬇️ Process Metrics", PROCESS.render, file_name="mli.prom", help="Prometheus text format for this server process.")
+
+def profile_report(prof):
+    with st.expander(f"🔬 Rerun Profile ({prof.samples:,} samples over {prof.seconds * 1000:,.0f} ms)", expanded=True):
+        st.dataframe(pd.DataFrame(prof.top()), use_container_width=True, hide_index=True, column_config={'Self %': st.column_config.NumberColumn(format="%.1f%%"), 'Total %': st.column_config.NumberColumn(format="%.1f%%")})
+        c_p1, c_p2 = st.columns(2)
+        c_p1.download_button("⬇️ Folded Stacks", prof.folded(), file_name="rerun.folded", help="For flamegraph.pl or speedscope.")
+        c_p2.button("Clear Profile", on_click=lambda: st.session_state.pop("profile", None))
 
 def parse_score_selection(selection_string):
     # Helper to extract points from string like "Level 1: (50 Points)"
@@ -87,86 +273,6 @@ def parse_score_selection(selection_string):
     if "20 Points" in selection_string: return 20
     return 0
 
-def create_excel_download(data, rent_roll_df):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        
-        # TAB 1: EXECUTIVE SUMMARY
-        summary_data = {
-            "Metric": ["Project Name", "Market", "Underwritten Date", "", "Total Project Cost", "Approved Loan Amount", "Equity Required", "Loan-to-Cost (LTC)", "", "Net Operating Income (NOI)", "Debt Coverage Ratio (DCR)", "Going-In Cap Rate", "Cash-on-Cash Return", "", "MLI Select Total Score", "Amortization Period", "Underwritten Interest Rate"],
-            "Value": [data['project_name'], data['market'], datetime.now().strftime('%Y-%m-%d'), "", f"${data['cost_base']:,.0f}", f"${data['approved_loan']:,.0f}", f"${data['equity']:,.0f}", f"{data['ltc']:.1f}%", "", f"${data['noi']:,.0f}", f"{data['dcr_actual']:.2f}x", f"{data['cap_rate']:.2f}%", f"{data['coc_return']:.2f}%", "", data['score'], f"{data['amort']} Years", f"{data['interest_rate']}%"]
-        }
-        pd.DataFrame(summary_data).to_excel(writer, sheet_name='Executive Summary', index=False)
-        
-        # TAB 2: INPUTS
-        inputs_data = {"Category": ["Scoring", "Scoring", "Scoring", "Scoring", "Market", "Market", "Market", "Expenses", "Expenses", "Expenses", "Expenses", "Expenses", "Expenses", "Expenses"], "Item": ["Affordability Points", "Energy Efficiency Points", "Accessibility Points", "Total Score", "CMHC Rent Cap Used", "Residential Units", "Affordable Units %", "Vacancy Rate Used", "Mgmt Fee %", "Property Taxes", "Insurance", "Utilities", "Maintenance (R&M)", "Replacement Reserves"], "Value": [data['pts_aff'], data['pts_nrg'], data['pts_acc'], data['score'], f"${data['rent_cap']:,.0f}", len(rent_roll_df), f"{data['aff_pct']:.1f}%", f"{data['vacancy']}%", "4.25%", f"${data['ex_tax']:,.0f}", f"${data['ex_ins']:,.0f}", f"${data['ex_util']:,.0f}", f"${data['ex_rm']:,.0f}", f"${data['ex_res']:,.0f}"]}
-        pd.DataFrame(inputs_data).to_excel(writer, sheet_name='Inputs & Assumptions', index=False)
-        
-        # TAB 3: RENT ROLL
-        rent_roll_df.to_excel(writer, sheet_name='Rent Roll', index=False)
-        
-        # TAB 4: PRO FORMA
-        pro_forma = []
-        curr_noi = data['noi']; debt = data['annual_debt_svc']
-        for i in range(1, 11):
-            pro_forma.append({"Year": i, "Net Operating Income (NOI)": curr_noi, "Annual Debt Service": debt, "Cash Flow": curr_noi - debt, "DCR": curr_noi / debt if debt > 0 else 0}); curr_noi *= 1.02
-        pd.DataFrame(pro_forma).to_excel(writer, sheet_name='10-Year Pro Forma', index=False)
-        
-        # TAB 5: STRESS TEST
-        stress_data = []
-        base = data['interest_rate']; loan = data['approved_loan']; amort = data['amort']
-        for r in [base-0.5, base, base+0.5, base+1.0, base+1.5]:
-            pmt = calculate_pmt(loan, r, amort)*12; dcr = data['noi']/pmt if pmt>0 else 0
-            stress_data.append({"Rate": f"{r:.2f}%", "Payment": pmt, "DCR": dcr, "Status": "PASS" if dcr>=1.10 else "FAIL"})
-        pd.DataFrame(stress_data).to_excel(writer, sheet_name='Stress Test', index=False)
-    return output.getvalue()
-
-# --- PDF ENGINE ---
-class PDF(FPDF):
-    def header(self):
-        self.set_font('Arial', 'B', 10); self.set_text_color(150, 150, 150); self.cell(0, 10, 'MLI Select Pro Analysis', 0, 1, 'R'); self.ln(5)
-    def footer(self):
-        self.set_y(-15); self.set_font('Arial', 'I', 8); self.set_text_color(150, 150, 150); self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
-    def watermark(self, text="DRAFT / UNAUDITED"):
-        self.set_font('Arial', 'B', 40); self.set_text_color(240, 240, 240); self.text(30, 150, text)
-
-def create_advanced_pdf(data, is_white_label, prepared_for, rent_roll_df, deal_notes):
-    pdf = PDF()
-    
-    # Page 1: Executive Summary
-    pdf.add_page()
-    if not is_white_label: pdf.watermark()
-    pdf.set_font('Arial', 'B', 24); pdf.set_text_color(33, 33, 33); pdf.cell(0, 15, data['project_name'], ln=1)
-    pdf.set_font('Arial', '', 11); pdf.cell(0, 8, f"Market: {data['market']} | Date: {datetime.now().strftime('%Y-%m-%d')}", ln=1)
-    if is_white_label: pdf.cell(0, 8, f"Prepared For: {prepared_for}", ln=1)
-    pdf.ln(10); pdf.set_fill_color(240, 244, 248); pdf.rect(10, 50, 190, 45, 'F'); pdf.set_xy(15, 55); pdf.set_font('Arial', 'B', 14); pdf.cell(60, 10, "Approved Loan"); pdf.cell(60, 10, "Total Score"); pdf.cell(60, 10, "Equity Required", ln=1)
-    pdf.set_xy(15, 65); pdf.set_font('Arial', 'B', 18); pdf.cell(60, 15, f"${data['approved_loan']:,.0f}"); pdf.cell(60, 15, f"{data['score']} Pts"); pdf.cell(60, 15, f"${data['equity']:,.0f}", ln=1)
-    pdf.ln(25); pdf.set_text_color(0, 0, 0); pdf.set_font('Arial', 'B', 14); pdf.cell(0, 10, "Financial Snapshot", ln=1); pdf.line(10, pdf.get_y(), 200, pdf.get_y()); pdf.ln(5); metrics = [("NOI", f"${data['noi']:,.0f}"), ("Cap Rate", f"{data['cap_rate']:.2f}%"), ("DCR", f"{data['dcr_actual']:.2f}x"), ("Cash-on-Cash", f"{data['coc_return']:.2f}%"), ("LTC", f"{data['ltc']:.1f}%")]; pdf.set_font('Arial', '', 12)
-    for l, v in metrics: pdf.cell(120, 8, l, 0); pdf.cell(60, 8, v, 0, 1, 'R')
-    if deal_notes: pdf.ln(10); pdf.set_font('Arial', 'B', 12); pdf.cell(0, 10, "Underwriter Notes", ln=1); pdf.set_font('Arial', '', 10); pdf.multi_cell(0, 6, deal_notes)
-    
-    # Page 2: Pro Forma & Sensitivity
-    pdf.add_page()
-    if not is_white_label: pdf.watermark()
-    pdf.set_font('Arial', 'B', 14); pdf.cell(0, 10, "10-Year Pro Forma", ln=1); pdf.line(10, pdf.get_y(), 200, pdf.get_y()); pdf.ln(5); pdf.set_fill_color(220, 220, 220); pdf.set_font('Arial', 'B', 9); pdf.cell(20, 8, "Year", 1, 0, 'C', 1); pdf.cell(40, 8, "NOI", 1, 0, 'R', 1); pdf.cell(40, 8, "Debt", 1, 0, 'R', 1); pdf.cell(40, 8, "Cash Flow", 1, 0, 'R', 1); pdf.cell(30, 8, "DCR", 1, 1, 'C', 1)
-    pdf.set_font('Arial', '', 9); noi = data['noi']; debt = data['annual_debt_svc']
-    for i in range(1, 11):
-        pdf.cell(20, 8, str(i), 1, 0, 'C'); pdf.cell(40, 8, f"{noi:,.0f}", 1, 0, 'R'); pdf.cell(40, 8, f"{debt:,.0f}", 1, 0, 'R'); pdf.cell(40, 8, f"{noi-debt:,.0f}", 1, 0, 'R'); pdf.cell(30, 8, f"{noi/debt:.2f}x", 1, 1, 'C'); noi *= 1.02
-    pdf.ln(10); pdf.set_font('Arial', 'B', 14); pdf.cell(0, 10, "Interest Rate Sensitivity", ln=1); pdf.line(10, pdf.get_y(), 200, pdf.get_y()); pdf.ln(5); pdf.set_fill_color(220, 220, 220); pdf.set_font('Arial', 'B', 9); pdf.cell(40, 8, "Rate", 1, 0, 'C', 1); pdf.cell(50, 8, "Payment", 1, 0, 'C', 1); pdf.cell(40, 8, "DCR", 1, 1, 'C', 1); pdf.set_font('Arial', '', 9); base = data['interest_rate']
-    for r in [base-0.5, base, base+0.5, base+1.0, base+1.5]:
-        pmt = calculate_pmt(data['approved_loan'], r, data['amort'])*12; dcr = data['noi']/pmt if pmt>0 else 0
-        pdf.cell(40, 8, f"{r:.2f}%", 1, 0, 'C'); pdf.cell(50, 8, f"${pmt:,.0f}", 1, 0, 'C'); pdf.set_text_color(220, 53, 69) if dcr < 1.10 else pdf.set_text_color(0, 0, 0); pdf.cell(40, 8, f"{dcr:.2f}x", 1, 1, 'C'); pdf.set_text_color(0, 0, 0)
-    
-    # Page 3: Rent Roll
-    pdf.add_page()
-    if not is_white_label: pdf.watermark()
-    pdf.set_font('Arial', 'B', 14); pdf.cell(0, 10, "Appendix A: Rent Roll", ln=1); pdf.line(10, pdf.get_y(), 200, pdf.get_y()); pdf.ln(5); pdf.set_fill_color(220, 220, 220); pdf.set_font('Arial', 'B', 10); pdf.cell(80, 10, "Unit", 1, 0, 'L', 1); pdf.cell(30, 10, "Count", 1, 0, 'C', 1); pdf.cell(40, 10, "Rent", 1, 0, 'R', 1); pdf.cell(40, 10, "Total", 1, 1, 'R', 1); pdf.set_font('Arial', '', 10)
-    if 'Total' not in rent_roll_df.columns: rent_roll_df['Total'] = rent_roll_df['Count'] * rent_roll_df['Rent ($)']
-    for i, r in rent_roll_df.iterrows():
-        pdf.cell(80, 10, str(r['Unit Type']), 1); pdf.cell(30, 10, str(r['Count']), 1, 0, 'C'); pdf.cell(40, 10, f"${r['Rent ($)']:,.0f}", 1, 0, 'R'); pdf.cell(40, 10, f"${r['Total']:,.0f}", 1, 1, 'R')
-    pdf.set_y(-40); pdf.set_font('Arial', 'I', 8); pdf.multi_cell(0, 5, DISCLAIMER_TEXT)
-    return pdf.output(dest='S').encode('latin-1')
-
 # ==========================================
 # 4. MAIN APP LOGIC
 # ==========================================
@@ -176,8 +282,8 @@ def login_screen():
         if os.path.exists("logo.png"): st.image("logo.png", width=200)
         else: st.markdown("<h1 style='text-align: center;'>MLI Select Pro</h1>", unsafe_allow_html=True)
         with st.form("login"):
-            st.text_input("Username"); st.text_input("Password", type="password")
-            if st.form_submit_button("Sign In"): st.session_state["logged_in"] = True; st.rerun()
+            user = st.text_input("Username"); password = st.text_input("Password", type="password")
+            if st.form_submit_button("Sign In"): st.session_state.update({"logged_in": True, "username": user.strip(), "admin": is_admin(user.strip(), password)}); st.rerun()
 
 def disclaimer_screen():
     c1, c2, c3 = st.columns([1, 2, 1])
@@ -187,17 +293,35 @@ def disclaimer_screen():
             if st.button("Enter Dashboard"): st.session_state["accepted_terms"] = True; st.rerun()
 
 def main_app():
+    # Times the whole rerun; an admin can arm the sampler for the next one
+    metrics_endpoint()
+    rerun = st.session_state["rerun"] = Rerun(st.session_state["telemetry"], st.session_state["session_id"], st.session_state["username"] or None)
+    sampler = Sampler().start() if st.session_state.pop("profile_next", False) else None
+    try: dashboard()
+    finally:
+        if sampler is not None: st.session_state["profile"] = sampler.stop()
+        rerun.finish()
+    if "profile" in st.session_state and st.session_state["admin"]: profile_report(st.session_state["profile"])
+
+def dashboard():
     with st.sidebar:
         if os.path.exists("logo.png"): st.image("logo.png", use_container_width=True)
         st.header("📂 Projects")
-        p_name = st.text_input("Current Deal", st.session_state["current_project"])
+        p_name = st.text_input("Current Deal", st.session_state["current_project"], key=f"project_name_{st.session_state['deal_version']}")
         st.session_state["current_project"] = p_name
-        if st.button("💾 Save Project"): st.session_state["projects"][p_name] = datetime.now(); st.toast("Saved!")
-        st.divider(); st.button("Logout", on_click=lambda: st.session_state.update({"logged_in": False}))
+        save_clicked = st.button("💾 Save Project")
+        deal_library(get_deal_store())
+        st.divider(); show_trace = st.toggle("🔧 Recompute Trace", help="Show which model stages were recomputed or served from cache on this rerun.")
+        if st.session_state["admin"]: admin_panel()
+        st.button("Logout", on_click=lambda: st.session_state.update({"logged_in": False}))
 
     st.title(f"{st.session_state['current_project']}")
-    gdf = load_canada_geo()
-    alias_map = {"Pickering": "Toronto", "Ajax": "Toronto", "Mississauga": "Toronto", "Brampton": "Toronto"}
+    with span("geo_load"): mkt = get_market_index()
+    # Widgets take their defaults from the last opened deal; keys carry a version so
+    # opening a deal replaces any values edited in the previous one.
+    inp = st.session_state["deal_inputs"]; wk = lambda k: f"{k}_{st.session_state['deal_version']}"
+    alias_map = MARKET_ALIASES
+    g = MODEL.run(st.session_state["model_memo"]); g.set(market_index=mkt, alias_map=alias_map, project_name=p_name)
     
     t1, t2, t3, t4 = st.tabs(["📍 Market", "⚙️ Financials", "🏦 Underwriting", "📚 Knowledge Base"])
     
@@ -206,17 +330,21 @@ def main_app():
         c1, c2 = st.columns([2, 1])
         with c1:
             st.markdown('<div class="section-header">Location Intelligence</div>', unsafe_allow_html=True)
-            if gdf is not None:
-                opts = sorted(list(set(list(gdf['CMANAME'].unique()) + list(alias_map.keys()))))
-                search = st.selectbox("Search Market", opts, index=opts.index("Toronto") if "Toronto" in opts else 0)
-                real_cma = alias_map.get(search, search)
-                d = gdf[gdf['CMANAME'] == real_cma].iloc[0] if not gdf[gdf['CMANAME'] == real_cma].empty else None
-                rent_cap = d.get('max_rent', 1550) if d is not None else 1550
-                if d is not None:
-                    m = folium.Map([d.geometry.centroid.y, d.geometry.centroid.x], zoom_start=9, tiles="CartoDB positron")
-                    folium.GeoJson(d.geometry).add_to(m)
-                    components.html(m._repr_html_(), height=350)
-            else: rent_cap = 1500
+            real_cma = search = "N/A"
+            if mkt is not None:
+                opts = sorted(set(mkt.names.tolist() + list(alias_map.keys())))
+                if st.radio("Locate By", ["Market Name", "Coordinates"], horizontal=True, key=wk("locate")) == "Market Name":
+                    m_default = inp.get('market', "Toronto")
+                    search = st.selectbox("Search Market", opts, index=opts.index(m_default) if m_default in opts else (opts.index("Toronto") if "Toronto" in opts else 0), key=wk("market"))
+                    real_cma = alias_map.get(search, search)
+                else:
+                    c_lat, c_lon = st.columns(2)
+                    lat = c_lat.number_input("Latitude", -90.0, 90.0, 43.6532, format="%.4f"); lon = c_lon.number_input("Longitude", -180.0, 180.0, -79.3832, format="%.4f")
+                    real_cma = search = mkt.locate(lat, lon) or "N/A"
+                    if real_cma == "N/A": st.warning("Location is outside every CMA boundary. Using the default rent cap.")
+                with span("market_lookup"): g.set(cma=real_cma); rent_cap = g['rent_cap']; found = g['market'] is not None
+                if found: market_map(mkt, real_cma)
+            else: g.set(cma=real_cma, rent_cap=1500); rent_cap = 1500
         with c2: 
             st.markdown('<div class="section-header">Metrics</div>', unsafe_allow_html=True)
             st.metric("CMHC Rent Cap", f"${rent_cap:,.0f}", help="Maximum rent per unit to qualify for Affordability Points in this specific zone.")
@@ -227,55 +355,52 @@ def main_app():
         c_inc, c_exp = st.columns(2)
         with c_inc:
             st.markdown('<div class="section-header">Income Strategy</div>', unsafe_allow_html=True)
-            st.caption("Enter unit mix. Affordability is calculated automatically based on the Rent Cap.")
-            df_temp = pd.DataFrame([{"Unit Type": "1-Bed", "Count": 10, "Rent ($)": 1500}, {"Unit Type": "2-Bed", "Count": 5, "Rent ($)": 2200}])
-            edited_df = st.data_editor(df_temp, num_rows="dynamic", use_container_width=True)
-            res_mask = ~edited_df['Unit Type'].str.contains('Parking|Retail', case=False)
-            aff_count = edited_df[res_mask & (edited_df['Rent ($)'] <= rent_cap)]['Count'].sum()
-            total_res = edited_df[res_mask]['Count'].sum()
-            aff_pct = (aff_count/total_res*100) if total_res > 0 else 0
-            if aff_pct >= 25: pts_auto = 100
-            elif aff_pct >= 15: pts_auto = 70
-            elif aff_pct >= 10: pts_auto = 50
-            else: pts_auto = 0
-            gross = (edited_df['Count'] * edited_df['Rent ($)']).sum(); potential_inc = gross * 12
+            st.caption("Enter unit mix or import a unit-level rent roll. Affordability is calculated automatically based on the Rent Cap.")
+            up = st.file_uploader("Import Rent Roll", type=["csv", "xlsx", "parquet"], key=wk("rent_roll_file"), help="One row per unit (Unit, Unit Type, Rent) or per unit type with a Count column. CSV, Excel or Parquet.")
+            if up is not None:
+                try:
+                    with span("rent_roll"): edited_df = load_rent_roll(up.getvalue(), up.name)
+                except Exception as e: st.error(f"Could not read {up.name}: {e}"); up = None
+            if up is None:
+                df_temp = pd.DataFrame(inp.get('rent_roll', [{"Unit Type": "1-Bed", "Count": 10, "Rent ($)": 1500}, {"Unit Type": "2-Bed", "Count": 5, "Rent ($)": 2200}]), columns=["Unit Type", "Count", "Rent ($)"])
+                edited_df = st.data_editor(df_temp, num_rows="dynamic", use_container_width=True, key=wk("rent_roll"))
+            with span("rent_roll"): g.set(rent_roll=edited_df); aff = g['affordability']
+            total_res = aff['total_res']; aff_pct = aff['aff_pct']; pts_auto = aff['pts_aff']
+            if up is not None:
+                st.dataframe(summarize_rent_roll(edited_df, rent_cap), use_container_width=True, hide_index=True, column_config={'Avg Rent': st.column_config.NumberColumn(format="$%.0f"), 'Monthly Rent': st.column_config.NumberColumn(format="$%.0f")})
+                blank = blank_rent_units(edited_df); untyped = unspecified_type_units(edited_df)
+                st.caption(f"{len(edited_df):,} rows imported | {aff['aff_count']:,.0f} of {total_res:,} residential units at or below ${rent_cap:,.0f}" + (f" | {blank:,} units with no rent (counted as units, not as affordable)" if blank else "")
+                           + (f" | {untyped:,} units with no unit type (counted as residential)" if untyped else ""))
 
         with c_exp:
             st.markdown('<div class="section-header">Operating Expenses</div>', unsafe_allow_html=True)
             c_e1, c_e2 = st.columns(2)
-            vac = c_e1.number_input("Vacancy Rate %", 3.0, help="CMHC uses the HIGHER of market vacancy or actuals. Residential minimum is typically 1.0% - 3.0%.")
-            mgmt = c_e2.number_input("Management Fee %", 4.25, help="Standard CMHC underwriting floor is 3.25% - 4.25% of EGI, even if self-managed.")
-            tax = st.number_input("Property Taxes ($/Year)", 35000, help="Annual Municipal Property Taxes.")
-            ins = st.number_input("Insurance Premium ($/Year)", 15000, help="Annual Building Insurance.")
-            util = st.number_input("Utilities ($/Year)", 25000, help="Landlord-paid portions (Gas, Water, Common Hydro).")
-            rm = st.number_input("Maintenance (R&M) ($/Year)", 10000, help="Day-to-day repairs. Standard is $850/unit/year.")
-            reserves = st.number_input("Replacement Reserves ($/Year)", total_res * 500, help="Mandatory Capital Reserve Fund contribution. Typically $500 - $900 per door per year.")
-            egi = potential_inc * (1 - vac/100); mgmt_amt = egi * (mgmt/100)
-            total_opex = tax + ins + util + rm + reserves + mgmt_amt; noi = egi - total_opex
-            chart = alt.Chart(pd.DataFrame({'Cat': ['Tax', 'Ins', 'Util', 'R&M', 'Rsrv', 'Mgmt'], 'Val': [tax, ins, util, rm, reserves, mgmt_amt]})).mark_arc(innerRadius=60).encode(theta='Val', color='Cat', tooltip=['Cat', 'Val']); st.altair_chart(chart, use_container_width=True)
+            vac = c_e1.number_input("Vacancy Rate %", value=float(inp.get('vacancy', 3.0)), key=wk("vacancy"), help="CMHC uses the HIGHER of market vacancy or actuals. Residential minimum is typically 1.0% - 3.0%.")
+            mgmt = c_e2.number_input("Management Fee %", value=float(inp.get('mgmt', 4.25)), key=wk("mgmt"), help="Standard CMHC underwriting floor is 3.25% - 4.25% of EGI, even if self-managed.")
+            tax = st.number_input("Property Taxes ($/Year)", value=int(inp.get('tax', 35000)), key=wk("tax"), help="Annual Municipal Property Taxes.")
+            ins = st.number_input("Insurance Premium ($/Year)", value=int(inp.get('ins', 15000)), key=wk("ins"), help="Annual Building Insurance.")
+            util = st.number_input("Utilities ($/Year)", value=int(inp.get('util', 25000)), key=wk("util"), help="Landlord-paid portions (Gas, Water, Common Hydro).")
+            rm = st.number_input("Maintenance (R&M) ($/Year)", value=int(inp.get('rm', 10000)), key=wk("rm"), help="Day-to-day repairs. Standard is $850/unit/year.")
+            reserves = st.number_input("Replacement Reserves ($/Year)", value=int(inp.get('reserves', total_res * 500)), key=wk("reserves") if 'reserves' in inp else wk(f"reserves_{total_res}"), help="Mandatory Capital Reserve Fund contribution. Typically $500 - $900 per door per year.")
+            g.set(vacancy=vac, mgmt=mgmt, tax=tax, ins=ins, util=util, rm=rm, reserves=reserves)
+            with span("charts"): st.altair_chart(g['expense_chart'], use_container_width=True)
 
         st.markdown("---")
         c_cost, c_score = st.columns(2)
         with c_cost: 
             st.markdown('<div class="section-header">Project Costs</div>', unsafe_allow_html=True)
-            cost_base = st.number_input("Total Project Cost", 12000000, help="Purchase Price + Renovations + Soft Costs + Closing Costs.")
+            cost_base = st.number_input("Total Project Cost", value=int(inp.get('cost_base', 12000000)), key=wk("cost_base"), help="Purchase Price + Renovations + Soft Costs + Closing Costs.")
         with c_score:
             st.markdown('<div class="section-header">MLI Select Scoring</div>', unsafe_allow_html=True)
             s1, s2, s3 = st.columns(3)
             with s1: 
-                # Expanded Labels
-                aff_options = [
-                    "None: 0 Points (0%)",
-                    "Level 1: 50 Points (10% Units)",
-                    "Level 2: 70 Points (15% Units)",
-                    "Level 3: 100 Points (25% Units)"
-                ]
-                if st.checkbox("Manual Override", help="Manually select points instead of auto-calculation"): 
-                    pts_aff_sel = st.selectbox("Affordability", aff_options, help="Units must be below the Rent Cap.")
-                    pts_aff = parse_score_selection(pts_aff_sel)
+                # Expanded Labels (from the affordability tiers, lowest first)
+                aff_options = ["None: 0 Points (0%)"] + [f"Level {i}: {pts} Points ({pct}% Units)" for i, (pct, pts) in enumerate(reversed(AFF_TIERS), 1)]
+                aff_override = st.checkbox("Manual Override", value=bool(inp.get('aff_override', False)), key=wk("aff_override"), help="Manually select points instead of auto-calculation"); pts_aff_sel = inp.get('aff_sel', aff_options[0])
+                if aff_override: 
+                    pts_aff_sel = st.selectbox("Affordability", aff_options, index=aff_options.index(pts_aff_sel) if pts_aff_sel in aff_options else 0, key=wk("aff_sel"), help="Units must be below the Rent Cap.")
                 else: 
                     st.metric("Affordability", f"{pts_auto} Points", help=f"Auto-calculated: {aff_pct:.1f}% of units qualify.")
-                    pts_aff = pts_auto
             
             with s2: 
                 nrg_options = [
@@ -284,8 +409,7 @@ def main_app():
                     "Level 2: 50 Points (25% > NECB)",
                     "Level 3: 100 Points (40% > NECB)"
                 ]
-                pts_nrg_sel = st.selectbox("Energy Efficiency", nrg_options, help=" Improvement over National Energy Code (NECB 2017).")
-                pts_nrg = parse_score_selection(pts_nrg_sel)
+                pts_nrg_sel = st.selectbox("Energy Efficiency", nrg_options, index=nrg_options.index(inp['nrg_sel']) if inp.get('nrg_sel') in nrg_options else 0, key=wk("nrg_sel"), help=" Improvement over National Energy Code (NECB 2017).")
                 
             with s3: 
                 acc_options = [
@@ -294,55 +418,61 @@ def main_app():
                     "Level 2: 30 Points (20% Units)",
                     "Level 3: 100 Points (100% Units)"
                 ]
-                pts_acc_sel = st.selectbox("Accessibility", acc_options, help="Percent of units meeting CSA B651-18 Universal Design standards.")
-                pts_acc = parse_score_selection(pts_acc_sel)
+                pts_acc_sel = st.selectbox("Accessibility", acc_options, index=acc_options.index(inp['acc_sel']) if inp.get('acc_sel') in acc_options else 0, key=wk("acc_sel"), help="Percent of units meeting CSA B651-18 Universal Design standards.")
             
-            score = pts_aff + pts_nrg + pts_acc
-            if score >= 100: rewards = {"ltv": 0.95, "amort": 50}; st.success(f"🌟 **Total Score: {score}** (95% LTV | 50yr)")
-            elif score >= 50: rewards = {"ltv": 0.95, "amort": 40}; st.info(f"✅ **Total Score: {score}** (95% LTV | 40yr)")
-            else: rewards = {"ltv": 0.75, "amort": 25}; st.warning(f"⚠️ **Total Score: {score}** (Standard 75% LTV | 25yr)")
+            g.set(pts_aff_manual=parse_score_selection(pts_aff_sel) if aff_override else None, pts_nrg=parse_score_selection(pts_nrg_sel), pts_acc=parse_score_selection(pts_acc_sel))
+            with span("underwriting"): score = g['score']['score']; rw = g['rewards']
+            terms = f"{rw['ltv']:.0%} LTV | {rw['amort']}yr"
+            if score >= REWARD_TIERS[0][0]: st.success(f"🌟 **Total Score: {score}** ({terms})")
+            elif score >= REWARD_TIERS[-1][0]: st.info(f"✅ **Total Score: {score}** ({terms})")
+            else: st.warning(f"⚠️ **Total Score: {score}** (Standard {terms})")
 
     # TAB 3: UNDERWRITING
     with t3:
         st.markdown('<div class="section-header">Underwriting Analysis</div>', unsafe_allow_html=True)
-        stress_rate = st.slider("Stress Test Interest Rate (%)", 3.0, 8.0, 4.5, 0.25, help="Test the loan feasibility at higher rates.")
+        stress_rate = st.slider("Stress Test Interest Rate (%)", 3.0, 8.0, float(inp.get('stress_rate', 4.5)), 0.25, key=wk("stress_rate"), help="Test the loan feasibility at higher rates.")
+        g.set(cost_base=cost_base, stress_rate=stress_rate)
         
-        loan_ltv = cost_base * rewards['ltv']
-        r_mo = stress_rate/100/12; n_mo = rewards['amort']*12
-        max_pmt = noi / 1.10
-        loan_dcr = max_pmt * ((1 - (1+r_mo)**(-n_mo)) / r_mo)
-        approved = min(loan_ltv, loan_dcr)
-        
-        c_chart = alt.Chart(pd.DataFrame({'Limit': ['Max LTV', 'Max DCR', 'Final Loan'], 'Value': [loan_ltv, loan_dcr, approved], 'Color': ['#CBD5E1', '#CBD5E1', '#10B981']})).mark_bar().encode(x='Limit', y='Value', color=alt.Color('Color', scale=None), tooltip=['Limit', 'Value']).properties(height=200); st.altair_chart(c_chart, use_container_width=True)
-
-        fee, _ = calculate_cmhc_fee(approved, score); final_loan = approved + fee; equity = cost_base - approved
-        actual_pmt = calculate_pmt(approved, stress_rate, rewards['amort']) * 12
-        dcr_final = noi / actual_pmt if actual_pmt > 0 else 0
-        coc = ((noi - actual_pmt) / equity * 100) if equity > 0 else 0
+        with span("underwriting"): uw = g['loan']; noi = g['noi']['noi']
+        with span("charts"): st.altair_chart(g['loan_chart'], use_container_width=True)
         
         m1, m2, m3, m4 = st.columns(4)
-        m1.metric("Net Operating Income", f"${noi:,.0f}", help="Total Revenue - Total Expenses"); m2.metric("Cap Rate", f"{(noi/cost_base*100):.2f}%", help="NOI / Total Cost")
-        m3.metric("Approved Loan (Base)", f"${approved:,.0f}", help="Lesser of LTV or DCR"); m4.metric("Cash-on-Cash Return", f"{coc:.2f}%", help="Annual Cash Flow / Equity")
+        m1.metric("Net Operating Income", f"${noi:,.0f}", help="Total Revenue - Total Expenses"); m2.metric("Cap Rate", f"{uw['cap_rate']:.2f}%", help="NOI / Total Cost")
+        m3.metric("Approved Loan (Base)", f"${uw['approved']:,.0f}", help="Lesser of LTV or DCR"); m4.metric("Cash-on-Cash Return", f"{uw['coc_return']:.2f}%", help="Annual Cash Flow / Equity")
+        
+        with span("underwriting"): pdf_data = g['report_data']
+        
+        st.divider(); goal_seek_panel(pdf_data, aff, g['rewards']['ltv'])
+        with span("sensitivity"): grid = g['sensitivity']
+        st.divider(); sensitivity_panel(grid)
+        st.divider(); risk_panel(pdf_data)
         
         st.divider(); c_d1, c_d2 = st.columns(2)
-        pdf_data = {
-            'project_name': st.session_state["current_project"], 'market': real_cma, 'rent_cap': rent_cap,
-            'score': score, 'approved_loan': final_loan, 'equity': equity, 'noi': noi, 'cap_rate': (noi/cost_base)*100,
-            'ltc': (approved/cost_base)*100, 'coc_return': coc, 'dcr_actual': dcr_final,
-            'pts_aff': pts_aff, 'aff_pct': aff_pct, 'pts_nrg': pts_nrg, 'pts_acc': pts_acc, 'vacancy': vac,
-            'annual_debt_svc': actual_pmt, 'cost_base': cost_base, 'interest_rate': stress_rate,
-            'ex_tax': tax, 'ex_ins': ins, 'ex_util': util, 'ex_rm': rm, 'ex_res': reserves, 'amort': rewards['amort']
-        }
         with c_d1:
-            st.markdown("**PDF Report**"); notes = st.text_area("Deal Notes", help="Add custom notes to the report."); is_wl = st.checkbox("Remove Watermark"); client = st.text_input("Client Name") if is_wl else ""
-            if st.button("📄 Generate Investor PDF"):
-                b = create_advanced_pdf(pdf_data, is_wl, client, edited_df, notes)
-                st.download_button("Download PDF", b, file_name="Report.pdf")
+            st.markdown("**PDF Report**"); notes = st.text_area("Deal Notes", value=inp.get('notes', ""), key=wk("notes"), help="Add custom notes to the report."); is_wl = st.checkbox("Remove Watermark"); client = st.text_input("Client Name") if is_wl else ""
+            with span("export_pdf"):
+                # One key per rerun, reusing the rent roll hash the model graph already took
+                pdf_key = export_key('pdf', pdf_data, edited_df, notes, is_wl, client, rent_roll_fp=g.fps['rent_roll'])
+                if st.button("📄 Generate Investor PDF"): st.session_state["export_jobs"]['pdf'] = get_export_service().submit('pdf', pdf_data, edited_df, notes, is_wl, client, key=pdf_key)
+                export_download('pdf', "Download PDF", "Report.pdf", pdf_key)
         with c_d2:
             st.markdown("**Excel Model**"); st.caption("Download full unlocked spreadsheet.")
-            if st.button("📊 Download Excel Model"):
-                x = create_excel_download(pdf_data, edited_df)
-                st.download_button("Download .xlsx", x, file_name="Model.xlsx")
+            with span("export_xlsx"):
+                xlsx_key = export_key('xlsx', pdf_data, edited_df, rent_roll_fp=g.fps['rent_roll'])
+                if st.button("📊 Download Excel Model"): st.session_state["export_jobs"]['xlsx'] = get_export_service().submit('xlsx', pdf_data, edited_df, key=xlsx_key)
+                export_download('xlsx', "Download .xlsx", "Model.xlsx", xlsx_key)
+
+    # TAB 1 (cont.): SCREEN ALL MARKETS with the current rent roll, costs and expenses
+    if mkt is not None:
+        with t1: screening_panel(mkt, edited_df, pdf_data, alias_map)
+
+    if save_clicked:
+        deal_inputs = {'market': search, 'rent_roll': edited_df.to_dict('records'), 'vacancy': vac, 'mgmt': mgmt, 'tax': tax, 'ins': ins, 'util': util, 'rm': rm,
+                       'reserves': reserves, 'cost_base': cost_base, 'aff_override': aff_override, 'aff_sel': pts_aff_sel, 'nrg_sel': pts_nrg_sel, 'acc_sel': pts_acc_sel, 'stress_rate': stress_rate, 'notes': notes}
+        get_deal_store().save_deal(p_name, deal_inputs, pdf_data); st.toast("Saved!")
+
+    st.session_state["rerun"].attrs.update({'market': real_cma, 'units': total_res, 'stages_computed': sum(t['Status'] == 'computed' for t in g.trace)})
+    if show_trace: recompute_trace(g.trace)
 
     # TAB 4: KNOWLEDGE BASE (BEEFED UP)
     with t4:
@@ -375,7 +505,11 @@ def main_app():
         * **Replacement Reserves:** Funds set aside that provide for the periodic replacement of building components that wear out more rapidly than the building itself (e.g., Roof, HVAC, Windows).
         """)
 
-if not st.session_state["logged_in"]: login_screen()
-elif not st.session_state["accepted_terms"]: disclaimer_screen()
-else: main_app()
-st.markdown(f'<div class="footer">MLI Select Pro © 2025 | {st.session_state["current_project"]}</div>', unsafe_allow_html=True)
\ No newline at end of file
+# Streamlit runs this file as __main__. Spawned export and simulation workers load it as
+# __mp_main__ and only get the definitions above, never the page.
+if __name__ == "__main__":
+    init_session(); st.markdown(APP_CSS, unsafe_allow_html=True)
+    if not st.session_state["logged_in"]: login_screen()
+    elif not st.session_state["accepted_terms"]: disclaimer_screen()
+    else: main_app()
+    st.markdown(f'<div class="footer">MLI Select Pro © 2025 | {st.session_state["current_project"]}</div>', unsafe_allow_html=True)
\ No newline at end of file
@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
+import pandas as pd
+from market_index import DEFAULT_RENT_CAP, MARKET_ALIASES, load_market_index
+from rent_roll import blank_rent_units, read_rent_roll, unspecified_type_units
+from reports import create_advanced_pdf, create_excel_download
+from underwriting import operating_income, rent_roll_metrics, underwrite
+
+# ==========================================
+# HEADLESS BATCH REPORT GENERATOR
+# ==========================================
+# python batch.py deals.csv -o reports/ --workers 4
+# Each input row carries the pdf_data keys plus a `rent_roll` column: a JSON list of
+# {"Unit Type", "Count", "Rent ($)"} rows or the path of a unit-level rent roll file.
+# Missing inputs fall back to the UI defaults. A deal that cannot be prepared or rendered
+# is reported as failed and the run carries on; the exit status is 1 if any deal failed.
+DEFAULTS = {'market': 'N/A', 'vacancy': 3.0, 'mgmt': 4.25, 'ex_tax': 35000.0, 'ex_ins': 15000.0, 'ex_util': 25000.0, 'ex_rm': 10000.0,
+            'pts_nrg': 0, 'pts_acc': 0, 'notes': '', 'white_label': False, 'prepared_for': ''}
+NUMERIC_INPUTS = ['cost_base', 'interest_rate', 'vacancy', 'mgmt', 'ex_tax', 'ex_ins', 'ex_util', 'ex_rm', 'ex_res', 'pts_aff', 'pts_nrg', 'pts_acc', 'rent_cap']
+REQUIRED_INPUTS = ['cost_base', 'interest_rate']
+CHUNK_ROWS = 500
+
+def read_deals(path, chunksize=CHUNK_ROWS):
+    # Yields DataFrames of at most chunksize deals (Parquet needs pyarrow)
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv': yield from pd.read_csv(path, chunksize=chunksize)
+    elif ext in ('.jsonl', '.ndjson', '.json'): yield from pd.read_json(path, lines=True, chunksize=chunksize)
+    elif ext in ('.parquet', '.pq'):
+        df = pd.read_parquet(path)
+        for i in range(0, len(df), chunksize): yield df.iloc[i:i + chunksize]
+    else: raise ValueError(f"Unsupported deal file type: {ext}")
+
+def _rent_roll(value):
+    # A JSON list of rows, or a path to a unit-level CSV/XLSX/Parquet rent roll
+    if isinstance(value, str) and not value.lstrip().startswith('['): return read_rent_roll(value)
+    rows = json.loads(value) if isinstance(value, str) else list(value)
+    return pd.DataFrame(rows, columns=['Unit Type', 'Count', 'Rent ($)'])
+
+def prepare_deals(deals, market_index=None, alias_map=MARKET_ALIASES):
+    # Underwrites a chunk of deals in one vectorized pass. Returns (jobs, failed): one job per
+    # deal, and (project_name, error) for each deal whose inputs could not be prepared.
+    deals = deals.reset_index(drop=True).copy()
+    for k, v in DEFAULTS.items():
+        deals[k] = deals[k].fillna(v) if k in deals else v
+    if 'project_name' not in deals: deals['project_name'] = [f"Deal {i + 1}" for i in range(len(deals))]
+    # One bad value fails its own deal rather than turning the whole column into strings
+    bad = {}
+    for k in REQUIRED_INPUTS:
+        if k not in deals: deals[k] = np.nan
+    for k in NUMERIC_INPUTS:
+        if k not in deals: continue
+        v = pd.to_numeric(deals[k], errors='coerce')
+        for i in np.flatnonzero(v.isna().to_numpy() & (deals[k].notna().to_numpy() | (k in REQUIRED_INPUTS))): bad.setdefault(i, []).append(k)
+        deals[k] = v
+    rolls = []; failed = []
+    for i, (name, v) in enumerate(zip(deals['project_name'], deals['rent_roll'] if 'rent_roll' in deals else [None] * len(deals))):
+        if i in bad: rolls.append(None); failed.append((name, f"missing or non-numeric {', '.join(bad[i])}")); continue
+        try:
+            if v is None or (not isinstance(v, (str, list)) and pd.isna(v)): raise ValueError("no rent roll")
+            rolls.append(_rent_roll(v))
+        except Exception as e: rolls.append(None); failed.append((name, f"rent roll: {e!r}"))
+    ok = [r is not None for r in rolls]
+    if not all(ok): deals = deals[ok].reset_index(drop=True); rolls = [r for r in rolls if r is not None]
+    if deals.empty: return [], failed
+    try: return _underwrite_chunk(deals, rolls, market_index, alias_map), failed
+    except Exception: pass
+    # Retry one deal at a time so a single bad row only fails itself
+    jobs = []
+    for i in range(len(deals)):
+        try: jobs += _underwrite_chunk(deals.iloc[[i]].reset_index(drop=True), rolls[i:i + 1], market_index, alias_map)
+        except Exception as e: failed.append((deals['project_name'].iloc[i], repr(e)))
+    return jobs, failed
+
+def _underwrite_chunk(deals, rolls, market_index, alias_map):
+    if 'rent_cap' not in deals: deals['rent_cap'] = np.nan
+    alias_map = alias_map or {}
+    lookup = (lambda m: (market_index.lookup(alias_map.get(m, m)) or {}).get('rent_cap', DEFAULT_RENT_CAP)) if market_index is not None else (lambda m: DEFAULT_RENT_CAP)
+    deals['rent_cap'] = [c if pd.notna(c) else lookup(m) for c, m in zip(deals['rent_cap'], deals['market'])]
+    rr = pd.DataFrame([rent_roll_metrics(r['Unit Type'], r['Count'], r['Rent ($)'], cap) for r, cap in zip(rolls, deals['rent_cap'])])
+    deals['aff_pct'] = rr['aff_pct'].astype(float); deals['potential_inc'] = rr['potential_inc'].astype(float)
+    deals['pts_aff'] = deals['pts_aff'].fillna(rr['pts_aff']) if 'pts_aff' in deals else rr['pts_aff']
+    deals['ex_res'] = deals['ex_res'].fillna(rr['total_res'] * 500) if 'ex_res' in deals else rr['total_res'] * 500
+    deals['score'] = deals['pts_aff'].astype(int) + deals['pts_nrg'].astype(int) + deals['pts_acc'].astype(int)
+    deals['noi'] = operating_income(deals['potential_inc'], deals['vacancy'], deals['mgmt'], deals['ex_tax'], deals['ex_ins'], deals['ex_util'], deals['ex_rm'], deals['ex_res'])['noi']
+    uw = underwrite(deals[['cost_base', 'noi', 'interest_rate', 'score']])
+    for k in ('approved_loan', 'fee', 'equity', 'cap_rate', 'ltc', 'coc_return', 'dcr_actual', 'annual_debt_svc'): deals[k] = uw[k]
+    deals['amort'] = uw['amort'].astype(int)
+    keys = ['project_name', 'market', 'rent_cap', 'score', 'approved_loan', 'equity', 'noi', 'cap_rate', 'ltc', 'coc_return', 'dcr_actual', 'pts_aff', 'aff_pct', 'pts_nrg', 'pts_acc',
+            'vacancy', 'annual_debt_svc', 'cost_base', 'interest_rate', 'ex_tax', 'ex_ins', 'ex_util', 'ex_rm', 'ex_res', 'amort', 'potential_inc', 'mgmt', 'fee']
+    records = deals[keys].to_dict('records')
+    return [{'data': d, 'rent_roll': r.to_dict('records'), 'notes': str(n), 'white_label': bool(w), 'prepared_for': str(p), 'blank_rent_units': blank_rent_units(r), 'unspecified_type_units': unspecified_type_units(r)}
+            for d, r, n, w, p in zip(records, rolls, deals['notes'], deals['white_label'], deals['prepared_for'])]
+
+def _slug(name):
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', str(name)).strip('_') or 'deal'
+
+def render_deal(job, out_dir, formats=('pdf', 'xlsx'), seq=0):
+    # Runs in a worker; writes files directly so only a small summary crosses processes
+    t = time.perf_counter(); base = os.path.join(out_dir, f"{seq:05d}_{_slug(job['data']['project_name'])}"); nbytes = 0
+    rr = pd.DataFrame(job['rent_roll'], columns=(['Unit'] if job['rent_roll'] and 'Unit' in job['rent_roll'][0] else []) + ['Unit Type', 'Count', 'Rent ($)'])
+    if 'pdf' in formats:
+        b = create_advanced_pdf(job['data'], job['white_label'], job['prepared_for'], rr.copy(), job['notes'])
+        with open(base + '.pdf', 'wb') as f: f.write(b)
+        nbytes += len(b)
+    if 'xlsx' in formats:
+        b = create_excel_download(job['data'], rr.copy())
+        with open(base + '.xlsx', 'wb') as f: f.write(b)
+        nbytes += len(b)
+    return job['data']['project_name'], nbytes, time.perf_counter() - t
+
+def run_batch(path, out_dir, workers=None, formats=('pdf', 'xlsx'), max_in_flight=None, log=sys.stderr):
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1; max_in_flight = max_in_flight or workers * 2
+    market_index = load_market_index()
+    t0 = time.perf_counter(); done = 0; failed = []; nbytes = 0; seq = 0; last = t0; blank = 0; untyped = 0
+    # Recycle workers periodically and cap queued jobs so memory stays flat on long runs
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=100) as ex:
+        pending = {}
+        def drain(block_until):
+            nonlocal done, nbytes, last
+            while len(pending) > block_until:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    name = pending.pop(fut)
+                    try: nbytes += fut.result()[1]; done += 1
+                    except Exception as e: failed.append((name, repr(e)))
+                if time.perf_counter() - last > 2:
+                    last = time.perf_counter(); print(f"  {done + len(failed)} deals | {done / (last - t0):.1f} deals/s", file=log)
+        for chunk in read_deals(path):
+            jobs, bad = prepare_deals(chunk, market_index); failed += bad
+            for job in jobs:
+                if job['blank_rent_units']:
+                    blank += job['blank_rent_units']; print(f"  NOTE {job['data']['project_name']}: {job['blank_rent_units']:,} units with no rent (counted as units, not as affordable)", file=log)
+                if job['unspecified_type_units']:
+                    untyped += job['unspecified_type_units']; print(f"  NOTE {job['data']['project_name']}: {job['unspecified_type_units']:,} units with no unit type (counted as residential)", file=log)
+                drain(max_in_flight - 1)
+                pending[ex.submit(render_deal, job, out_dir, formats, seq)] = job['data']['project_name']; seq += 1
+        drain(0)
+    elapsed = time.perf_counter() - t0
+    total = done + len(failed)
+    summary = {'deals': total, 'succeeded': done, 'failed': len(failed), 'seconds': round(elapsed, 2), 'deals_per_sec': round(done / elapsed, 2) if elapsed else 0,
+               'mb_written': round(nbytes / 1e6, 2), 'workers': workers, 'blank_rent_units': blank, 'unspecified_type_units': untyped}
+    print(f"Generated {done}/{total} deal packages in {elapsed:.1f}s ({summary['deals_per_sec']} deals/s, {summary['mb_written']} MB, {workers} workers)", file=log)
+    for name, err in failed: print(f"  FAILED {name}: {err}", file=log)
+    return summary, failed
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Underwrite a file of deals and write the investor PDF and Excel model for each.")
+    p.add_argument("deals", help="CSV, Parquet or JSON-lines file of deals")
+    p.add_argument("-o", "--out", default="reports", help="Output directory (default: reports)")
+    p.add_argument("-w", "--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    p.add_argument("--formats", nargs="+", choices=["pdf", "xlsx"], default=["pdf", "xlsx"])
+    args = p.parse_args(argv)
+    summary, failed = run_batch(args.deals, args.out, args.workers, tuple(args.formats))
+    print(json.dumps(summary))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
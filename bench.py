@@ -0,0 +1,305 @@
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# HEADLESS PERFORMANCE BENCHMARKS
+# ==========================================
+# python bench.py run -o .bench/after.json            time every path (no browser needed)
+# python bench.py compare .bench/before.json .bench/after.json   flag slowdowns and errors (exit 1)
+# Uses app_data.geojson when present, otherwise a synthetic CMA layer of the same shape,
+# and runs everything inside a scratch directory so no deal DB or export cache is touched.
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = ".bench"
+REPEAT = 5
+UNIT_SIZES = (10, 1_000, 10_000)
+QUICK_UNIT_SIZES = (10, 1_000)
+SYNTHETIC_MARKETS = 150
+REGRESSION_THRESHOLD = 0.25  # fractional slowdown in the median
+MIN_DELTA_MS = 0.5  # ignore changes smaller than timer noise
+BENCHMARKS = []
+
+def bench(name, repeat=REPEAT, fresh=False):
+    # Registers a setup function that returns the callable to time. fresh=True calls the
+    # setup before every run (cold paths); otherwise once, followed by an untimed warm-up.
+    def register(fn): BENCHMARKS.append((name, fn, repeat, fresh)); return fn
+    return register
+
+def _time(thunk):
+    t = time.perf_counter(); thunk(); return time.perf_counter() - t
+
+def synthetic_geojson(path, n=SYNTHETIC_MARKETS, seed=0):
+    # Irregular many-vertex polygons on a lat/lon grid over southern Canada
+    import shapely
+    rng = np.random.default_rng(seed); cols = int(np.ceil(np.sqrt(n)))
+    names = ["Toronto"] + [f"Market {i:03d}" for i in range(1, n)]; features = []
+    for i, name in enumerate(names):
+        x, y = -125 + (i % cols) * 4.0, 43 + (i // cols) * 0.9
+        ang = np.linspace(0, 2 * np.pi, 400, endpoint=False); rad = 0.4 * (1 + 0.15 * np.sin(ang * rng.integers(3, 9)) + 0.05 * rng.standard_normal(400))
+        poly = shapely.Polygon(np.c_[x + rad * np.cos(ang) * 1.5, y + rad * np.sin(ang)])
+        features.append({"type": "Feature", "properties": {"CMANAME": name, "max_rent": float(rng.integers(1100, 2200))}, "geometry": json.loads(shapely.to_geojson(poly))})
+    with open(path, "w") as f: json.dump({"type": "FeatureCollection", "features": features}, f)
+    return path
+
+def synthetic_rent_roll(units, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'Unit': [f"{100 + i}" for i in range(units)],
+                         'Unit Type': pd.Categorical(rng.choice(['Bachelor', '1-Bed', '2-Bed', '3-Bed', 'Parking'], units, p=[.15, .4, .3, .1, .05])),
+                         'Count': np.ones(units, dtype='int32'), 'Rent ($)': rng.normal(1700, 350, units).round()})
+
+def deal_data(rent_roll_df, rent_cap=1550.0):
+    # pdf_data for a rent roll, built the way the app builds it
+    from underwriting import operating_income, rent_roll_metrics, underwrite
+    rr = rent_roll_metrics(rent_roll_df['Unit Type'], rent_roll_df['Count'], rent_roll_df['Rent ($)'], rent_cap)
+    units = float(rr['total_res']); d = {'project_name': 'Benchmark Deal', 'market': 'Toronto', 'rent_cap': rent_cap, 'cost_base': units * 250_000, 'interest_rate': 4.5,
+                                         'vacancy': 3.0, 'mgmt': 4.25, 'ex_tax': units * 1_200, 'ex_ins': units * 500, 'ex_util': units * 800, 'ex_rm': units * 850, 'ex_res': units * 500,
+                                         'potential_inc': float(rr['potential_inc']), 'aff_pct': float(rr['aff_pct']), 'pts_aff': int(rr['pts_aff']), 'pts_nrg': 30, 'pts_acc': 20}
+    d['score'] = d['pts_aff'] + d['pts_nrg'] + d['pts_acc']
+    d['noi'] = float(operating_income(d['potential_inc'], d['vacancy'], d['mgmt'], d['ex_tax'], d['ex_ins'], d['ex_util'], d['ex_rm'], d['ex_res'])['noi'])
+    uw = underwrite(d)
+    d.update({k: float(uw[k]) for k in ('approved_loan', 'fee', 'equity', 'cap_rate', 'ltc', 'coc_return', 'dcr_actual', 'annual_debt_svc')}); d['amort'] = int(uw['amort'])
+    return d
+
+def deal_frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'cost_base': rng.uniform(5e6, 50e6, n), 'interest_rate': rng.uniform(3, 7, n), 'score': rng.choice([0, 50, 70, 100], n),
+                         'potential_inc': rng.uniform(5e5, 6e6, n), 'vacancy': 3.0, 'mgmt': 4.25, 'ex_tax': rng.uniform(2e4, 3e5, n), 'ex_ins': 15000.0,
+                         'ex_util': 25000.0, 'ex_rm': 10000.0, 'ex_res': 10000.0})
+
+# --- UNDERWRITING MATH ---
+@bench("underwriting.calculate_pmt.scalar")
+def _pmt_scalar(ctx):
+    from underwriting import calculate_pmt
+    return lambda: calculate_pmt(10_000_000, 4.5, 50)
+
+@bench("underwriting.calculate_pmt.100k")
+def _pmt_vector(ctx):
+    from underwriting import calculate_pmt
+    d = ctx['deals_100k']; loans = d['cost_base'].to_numpy() * 0.9; rates = d['interest_rate'].to_numpy()
+    return lambda: calculate_pmt(loans, rates, 40)
+
+@bench("underwriting.calculate_cmhc_fee.100k")
+def _fee_vector(ctx):
+    from underwriting import calculate_cmhc_fee
+    d = ctx['deals_100k']; loans = d['cost_base'].to_numpy() * 0.9; score = d['score'].to_numpy()
+    return lambda: calculate_cmhc_fee(loans, score)
+
+@bench("underwriting.size_loan.100k")
+def _size_loan(ctx):
+    from underwriting import size_loan
+    d = ctx['deals_100k']; cost = d['cost_base'].to_numpy(); rate = d['interest_rate'].to_numpy(); noi = d['potential_inc'].to_numpy() * 0.6
+    return lambda: size_loan(cost, noi, rate, 40, 0.95)
+
+@bench("underwriting.underwrite.single")
+def _underwrite_one(ctx):
+    from underwriting import underwrite
+    d = {k: ctx['deal_10'][k] for k in ('cost_base', 'interest_rate', 'score', 'noi')}
+    return lambda: underwrite(d)
+
+@bench("underwriting.underwrite.100k")
+def _underwrite_many(ctx):
+    from underwriting import underwrite
+    return lambda: underwrite(ctx['deals_100k'])
+
+@bench("cashflow.projection.10k", repeat=3)
+def _projection(ctx):
+    from cashflow import cash_flow_projection
+    from underwriting import underwrite
+    d = ctx['deals_100k'].iloc[:10_000]; d = pd.concat([d, underwrite(d)[['noi', 'approved_loan', 'fee', 'equity', 'cap_rate', 'amort']]], axis=1)
+    return lambda: cash_flow_projection(d)
+
+@bench("goal_seek.solve.100k", repeat=3)
+def _solve(ctx):
+    from goal_seek import solve
+    return lambda: solve(ctx['deals_100k'])
+
+# --- GEO: INDEX LOAD, MARKET FILTER, MAP HTML ---
+@bench("geo.build_index", repeat=3, fresh=True)
+def _geo_build(ctx):
+    from market_index import build_market_index
+    dest = os.path.join(ctx['tmp'], f"build_{time.perf_counter_ns()}.npz")
+    return lambda: build_market_index(ctx['geojson'], dest)
+
+@bench("geo.load_market_index.cold", fresh=True)
+def _geo_cold(ctx):
+    # Fresh copy each run, so no in-process cache is reused; copyfile leaves it in the OS page
+    # cache, so this times the .npz parse and R-tree build, not disk I/O
+    from market_index import load_market_index
+    path = os.path.join(ctx['tmp'], f"cold_{time.perf_counter_ns()}.npz"); shutil.copyfile(ctx['index_path'], path)
+    return lambda: load_market_index(path, ctx['geojson'])
+
+@bench("geo.load_market_index.warm")
+def _geo_warm(ctx):
+    # The app's accessor after the first session: st.cache_resource hands back the loaded index
+    import streamlit as st
+    from market_index import load_market_index
+    return st.cache_resource(show_spinner=False)(lambda: load_market_index(ctx['index_path'], ctx['geojson']))
+
+@bench("geo.market_lookup")
+def _geo_lookup(ctx):
+    mkt = ctx['index']; names = mkt.names.tolist()
+    return lambda: [mkt.lookup(n) for n in names]
+
+@bench("geo.market_locate.1k")
+def _geo_locate(ctx):
+    mkt = ctx['index']; pts = ctx['index'].centroid[np.arange(1000) % len(ctx['index'])]
+    return lambda: [mkt.locate(y, x) for x, y in pts]
+
+@bench("geo.screen_markets")
+def _geo_screen(ctx):
+    from screening import screen_markets
+    return lambda: screen_markets(ctx['index'], ctx['rent_rolls'][10], ctx['deal_10'])
+
+@bench("geo.render_market_map.cold", fresh=True)
+def _map_cold(ctx):
+    from maps import HtmlLRU, _simplified_layer, render_market_map
+    _simplified_layer.cache_clear()
+    return lambda: render_market_map(ctx['index'], "Toronto", cache=HtmlLRU())
+
+@bench("geo.render_market_map.warm")
+def _map_warm(ctx):
+    from maps import HtmlLRU, render_market_map
+    cache = HtmlLRU()
+    return lambda: render_market_map(ctx['index'], "Toronto", cache=cache)
+
+@bench("geo.render_choropleth", repeat=3, fresh=True)
+def _choropleth(ctx):
+    from maps import HtmlLRU, _feature_collection, render_choropleth
+    _feature_collection.cache_clear(); vals = pd.Series(ctx['index'].rent_caps(), index=ctx['index'].names)
+    return lambda: render_choropleth(ctx['index'], vals, "Rent Cap", cache=HtmlLRU())
+
+@bench("geo.render_choropleth.warm")
+def _choropleth_warm(ctx):
+    from maps import HtmlLRU, render_choropleth
+    cache = HtmlLRU(); vals = pd.Series(ctx['index'].rent_caps(), index=ctx['index'].names)
+    return lambda: render_choropleth(ctx['index'], vals, "Rent Cap", cache=cache)
+
+# --- EXPORTS (registered per rent-roll size in run()) ---
+def _export_benches(sizes):
+    from reports import create_advanced_pdf, create_excel_download
+    out = []
+    for n in sizes:
+        rep = 3 if n < 10_000 else 2
+        out.append((f"export.pdf.{n}_units", lambda ctx, n=n: (lambda: create_advanced_pdf(ctx[f'deal_{n}'], False, "", ctx['rent_rolls'][n].copy(), "Benchmark")), rep, False))
+        out.append((f"export.xlsx.{n}_units", lambda ctx, n=n: (lambda: create_excel_download(ctx[f'deal_{n}'], ctx['rent_rolls'][n])), rep, False))
+    return out
+
+# --- END-TO-END RERUN (streamlit.testing) ---
+def _apptest(ctx):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(HERE, "app.py"), default_timeout=120)
+    at.session_state["logged_in"] = True; at.session_state["accepted_terms"] = True
+    return at
+
+def _e2e_benches():
+    def first_run(ctx):
+        at = _apptest(ctx)
+        return at.run
+    def rerun(ctx):
+        at = _apptest(ctx); at.run(); rates = [4.0, 4.25, 4.5, 4.75]; state = {'i': 0}
+        def step():
+            state['i'] += 1; at.slider[0].set_value(rates[state['i'] % len(rates)]); at.run()
+        return step
+    return [("e2e.app.first_run", first_run, 3, True), ("e2e.app.rerun_stress_rate", rerun, REPEAT, False)]
+
+def _context(tmp, geojson, sizes):
+    from market_index import build_market_index, load_market_index
+    index_path = os.path.join(tmp, "app_data.idx.npz"); build_market_index(geojson, index_path)
+    ctx = {'tmp': tmp, 'geojson': geojson, 'index_path': index_path, 'index': load_market_index(index_path, geojson),
+           'deals_100k': deal_frame(100_000), 'rent_rolls': {n: synthetic_rent_roll(n) for n in sorted(set(sizes) | {10})}}
+    for n, rr in ctx['rent_rolls'].items(): ctx[f'deal_{n}'] = deal_data(rr)
+    return ctx
+
+def _meta():
+    import streamlit
+    try: commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except Exception: commit = None
+    return {'created': datetime.now().isoformat(timespec='seconds'), 'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'numpy': np.__version__, 'pandas': pd.__version__, 'streamlit': streamlit.__version__}
+
+def run(out=None, only=None, quick=False, geojson=None, e2e=True, log=sys.stderr):
+    sizes = QUICK_UNIT_SIZES if quick else UNIT_SIZES
+    tmp = tempfile.mkdtemp(prefix="mli-bench-"); cwd = os.getcwd()
+    src = os.path.abspath(geojson) if geojson else os.path.join(cwd, "app_data.geojson")
+    try:
+        # The app reads app_data.geojson and writes deals.db / .cache relative to the cwd
+        if os.path.exists(src): shutil.copyfile(src, os.path.join(tmp, "app_data.geojson"))
+        else: synthetic_geojson(os.path.join(tmp, "app_data.geojson"))
+        os.chdir(tmp); sys.path.insert(0, HERE)
+        ctx = _context(tmp, os.path.join(tmp, "app_data.geojson"), sizes)
+        todo = BENCHMARKS + _export_benches(sizes) + (_e2e_benches() if e2e else [])
+        if only: todo = [b for b in todo if re.search(only, b[0])]
+        results = {}
+        for name, setup, repeat, fresh in todo:
+            repeat = min(repeat, 3) if quick else repeat
+            try:
+                if fresh: times = [_time(setup(ctx)) for _ in range(repeat)]
+                else:
+                    thunk = setup(ctx); thunk(); times = [_time(thunk) for _ in range(repeat)]
+            except Exception as e:
+                print(f"  {name:<40} FAILED: {e!r}", file=log); results[name] = {'error': repr(e)}; continue
+            results[name] = {'median_ms': float(np.median(times) * 1000), 'min_ms': float(np.min(times) * 1000), 'mean_ms': float(np.mean(times) * 1000), 'runs': len(times)}
+            print(f"  {name:<40} {results[name]['median_ms']:>10.2f} ms  (min {results[name]['min_ms']:.2f}, n={len(times)})", file=log)
+    finally:
+        os.chdir(cwd); shutil.rmtree(tmp, ignore_errors=True)
+    report = {'meta': {**_meta(), 'quick': quick, 'synthetic_geo': not os.path.exists(src)}, 'results': results}
+    if out:
+        os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+        with open(out, "w") as f: json.dump(report, f, indent=2)
+        print(f"Wrote {len(results)} results to {out}", file=log)
+    return report
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD, min_delta_ms=MIN_DELTA_MS, out=sys.stdout):
+    # Returns the failing benchmark names: regressed medians (small absolute deltas ignored),
+    # plus any benchmark that errored in the current run or has gone missing from it
+    base, cur = baseline['results'], current['results']; regressions = []; broken = []
+    print(f"{'benchmark':<40} {'baseline':>11} {'current':>11} {'change':>8}", file=out)
+    for name in sorted(set(base) | set(cur)):
+        b, c = base.get(name, {}), cur.get(name, {})
+        if 'median_ms' not in c:
+            status = "ERROR" if 'error' in c else "MISSING" if name not in cur else "n/a"
+            if status != "n/a": broken.append(name)
+            print(f"{name:<40} {'-' if 'median_ms' not in b else format(b['median_ms'], '.2f'):>11} {'-':>11} {status:>8}", file=out); continue
+        if 'median_ms' not in b:
+            print(f"{name:<40} {'-':>11} {c['median_ms']:>11.2f} {'new':>8}", file=out); continue
+        ratio = c['median_ms'] / b['median_ms'] if b['median_ms'] > 0 else np.inf; delta = c['median_ms'] - b['median_ms']
+        flag = ""
+        if ratio > 1 + threshold and delta > min_delta_ms: flag = "  REGRESSION"; regressions.append(name)
+        elif ratio < 1 - threshold and -delta > min_delta_ms: flag = "  faster"
+        print(f"{name:<40} {b['median_ms']:>11.2f} {c['median_ms']:>11.2f} {(ratio - 1) * 100:>+7.1f}%{flag}", file=out)
+    print(f"\n{len(regressions)} regression(s) over {threshold:.0%}, {len(broken)} errored or missing (baseline {baseline['meta'].get('commit')}, current {current['meta'].get('commit')})", file=out)
+    return regressions + broken
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark the underwriting, geo, export and end-to-end app paths without a browser.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="Run the benchmarks and save the results as JSON")
+    r.add_argument("-o", "--out", default=os.path.join(RESULTS_DIR, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json"))
+    r.add_argument("-k", "--only", help="Regex of benchmark names to run")
+    r.add_argument("--quick", action="store_true", help="Fewer repeats and no 10k-unit exports")
+    r.add_argument("--geojson", help="CMA GeoJSON to use (default: ./app_data.geojson, else a synthetic layer)")
+    r.add_argument("--no-e2e", action="store_true", help="Skip the streamlit.testing end-to-end runs")
+    c = sub.add_parser("compare", help="Compare two result files; exits 1 on regressions or errored/missing benchmarks")
+    c.add_argument("baseline"); c.add_argument("current")
+    c.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="Allowed slowdown of the median (default: 0.25)")
+    c.add_argument("--min-delta-ms", type=float, default=MIN_DELTA_MS)
+    args = p.parse_args(argv)
+    if args.cmd == "run":
+        report = run(args.out, args.only, args.quick, args.geojson, not args.no_e2e)
+        return 1 if any('error' in r for r in report['results'].values()) else 0
+    with open(args.baseline) as f: baseline = json.load(f)
+    with open(args.current) as f: current = json.load(f)
+    return 1 if compare(baseline, current, args.threshold, args.min_delta_ms) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
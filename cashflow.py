@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from underwriting import _out, calculate_pmt, score_rewards, size_loan
+
+# ==========================================
+# MONTHLY AMORTIZATION & MULTI-LINE CASH FLOW ENGINE
+# ==========================================
+# Inputs broadcast like the underwriting engine: pass scalars for one deal, or arrays
+# shaped (deals,) / (scenarios, deals) to project a whole pipeline in one call. Time is
+# always the last axis (months for the schedule, years for the projection).
+MAX_PERIODS = 600  # 50-year MLI Select amortization
+TERM_YEARS = 10
+HOLD_YEARS = 10
+# Annual growth (%) per operating line
+DEFAULT_GROWTH = {'rent': 2.0, 'tax': 2.5, 'ins': 3.0, 'util': 2.5, 'rm': 2.5, 'res': 2.0}
+EXPENSE_LINES = [('tax', 'ex_tax'), ('ins', 'ex_ins'), ('util', 'ex_util'), ('rm', 'ex_rm'), ('res', 'ex_res')]
+
+def amortization_schedule(principal, annual_rate, amort_years, term_years=TERM_YEARS, renewal_rates=None, periods=None):
+    # Fixed payment within each term; at renewal the rate resets (renewal_rates[..., k] for
+    # term k + 2, the last one carrying forward) and the balance re-amortizes over what is left.
+    principal = np.asarray(principal, dtype=float); rate = np.asarray(annual_rate, dtype=float)
+    n = np.rint(np.asarray(amort_years, dtype=float) * 12)
+    renewal = None if renewal_rates is None else np.atleast_1d(np.asarray(renewal_rates, dtype=float))
+    shape = np.broadcast_shapes(principal.shape, rate.shape, n.shape, () if renewal is None else renewal.shape[:-1])
+    T = int(min(periods or n.max(), MAX_PERIODS)); tm = int(term_years * 12)
+    out = {k: np.zeros(shape + (T,)) for k in ('rate', 'payment', 'interest', 'principal', 'balance')}
+    bal = np.broadcast_to(principal, shape).copy()
+    for j, t0 in enumerate(range(0, T, tm)):
+        t1 = min(t0 + tm, T); k = np.arange(1, t1 - t0 + 1)
+        r_ann = rate if j == 0 or renewal is None else renewal[..., min(j - 1, renewal.shape[-1] - 1)]
+        r_ann = np.broadcast_to(r_ann, shape); r = r_ann[..., None] / 100 / 12
+        left = np.maximum(n - t0, 0)
+        pmt = np.where(left > 0, np.nan_to_num(calculate_pmt(bal, r_ann, np.maximum(left, 1) / 12)), 0)[..., None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            g = (1 + r)**k
+            b = np.where(r == 0, bal[..., None] - pmt * k, bal[..., None] * g - pmt * (g - 1) / np.where(r == 0, 1, r))
+        b = np.where(t0 + k <= np.asarray(n)[..., None], np.maximum(b, 0), 0)
+        prev = np.concatenate([bal[..., None], b[..., :-1]], axis=-1)
+        out['rate'][..., t0:t1] = r_ann[..., None]; out['balance'][..., t0:t1] = b
+        out['interest'][..., t0:t1] = prev * r; out['principal'][..., t0:t1] = prev - b
+        bal = b[..., -1]
+    out['payment'] = out['interest'] + out['principal']
+    return out
+
+def irr(flows, lo=-0.99, hi=10.0, iters=64):
+    # Annual IRR (%) by bisection on every row at once; NaN where NPV does not change sign
+    flows = np.asarray(flows, dtype=float); t = np.arange(flows.shape[-1])
+    npv = lambda x: (flows / (1 + x[..., None])**t).sum(axis=-1)
+    lo = np.full(flows.shape[:-1], lo); hi = np.full(flows.shape[:-1], hi); f_lo = npv(lo)
+    ok = np.sign(f_lo) != np.sign(npv(hi))
+    for _ in range(iters):
+        mid = (lo + hi) / 2; f_mid = npv(mid); same = np.sign(f_mid) == np.sign(f_lo)
+        lo = np.where(same, mid, lo); f_lo = np.where(same, f_mid, f_lo); hi = np.where(same, hi, mid)
+    return _out(np.where(ok, (lo + hi) / 2 * 100, np.nan))
+
+def cash_flow_projection(data, years=HOLD_YEARS, growth=None, term_years=TERM_YEARS, renewal_rates=None, exit_cap=None, refi_ltv=None):
+    # data: approved_loan (and fee), interest_rate, amort, equity, potential_inc, vacancy, mgmt
+    # and the ex_* lines; cap_rate and score supply the exit cap and refinance LTV defaults.
+    # Year 1 reproduces the underwritten NOI; one extra operating year values the exit.
+    g = {**DEFAULT_GROWTH, **(growth or {})}; col = lambda k: np.asarray(data[k], dtype=float)
+    has = lambda k: k in (data.columns if isinstance(data, pd.DataFrame) else data)
+    y = np.arange(years + 1); f = lambda k: (1 + np.asarray(g[k], dtype=float)[..., None] / 100)**y
+    rent = col('potential_inc')[..., None] * f('rent')
+    egi = rent * (1 - col('vacancy')[..., None] / 100); mgmt_amt = egi * col('mgmt')[..., None] / 100
+    opex = mgmt_amt + sum(col(c)[..., None] * f(k) for k, c in EXPENSE_LINES); noi = egi - opex
+
+    # Debt service is sized on the base loan as in underwrite(); the CMHC premium (fee) is excluded
+    loan = col('approved_loan') - (col('fee') if has('fee') else 0)
+    sched = amortization_schedule(loan, col('interest_rate'), col('amort'), term_years, renewal_rates, periods=years * 12)
+    annual = lambda a: a.reshape(a.shape[:-1] + (years, 12)).sum(axis=-1)
+    debt, interest, principal = annual(sched['payment']), annual(sched['interest']), annual(sched['principal'])
+    balance = sched['balance'][..., 11::12]; rate = sched['rate'][..., 11::12]
+    noi_y = noi[..., :years]; cash_flow = noi_y - debt
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dcr = np.where(debt > 0, noi_y / debt, 0)
+    # Value at each year end capitalises the following year's NOI
+    cap = np.asarray(col('cap_rate') if exit_cap is None else exit_cap, dtype=float)[..., None] / 100
+    value = noi[..., 1:] / cap
+    # Cash-out available from refinancing at each year end under the same MLI sizing rules
+    ltv = score_rewards(col('score'))[0] if refi_ltv is None else refi_ltv
+    new_loan = size_loan(value, noi[..., 1:], rate, col('amort')[..., None], np.asarray(ltv, dtype=float)[..., None])[2]
+    refi = np.maximum(new_loan - balance, 0)
+    flows = np.concatenate([np.broadcast_to(-col('equity')[..., None], cash_flow.shape[:-1] + (1,)), cash_flow], axis=-1); flows[..., -1] += value[..., -1] - balance[..., -1]
+    return {'year': y[1:], 'rental_income': rent[..., :years], 'egi': egi[..., :years], 'opex': opex[..., :years], 'noi': noi_y,
+            'interest': interest, 'principal': principal, 'debt_service': debt, 'cash_flow': cash_flow, 'dcr': dcr,
+            'balance': balance, 'equity_buildup': loan[..., None] - balance, 'value': value, 'equity': value - balance,
+            'refi_proceeds': refi, 'irr': irr(flows), 'schedule': sched}
+
+def pro_forma_table(p):
+    # One deal's cash_flow_projection() as the annual table used by the exports
+    return pd.DataFrame({"Year": p['year'], "Rental Income": p['rental_income'], "Operating Expenses": p['opex'], "Net Operating Income (NOI)": p['noi'],
+                         "Interest": p['interest'], "Principal": p['principal'], "Annual Debt Service": p['debt_service'], "Cash Flow": p['cash_flow'], "DCR": p['dcr'],
+                         "Loan Balance": p['balance'], "Equity Buildup": p['equity_buildup'], "Property Value": p['value'], "Refinance Proceeds": p['refi_proceeds']})
+
+def amortization_table(data, term_years=TERM_YEARS, renewal_rates=None):
+    s = amortization_schedule(data['approved_loan'] - data.get('fee', 0), data['interest_rate'], data['amort'], term_years, renewal_rates)
+    return pd.DataFrame({"Month": np.arange(1, s['balance'].shape[-1] + 1), "Rate %": s['rate'], "Payment": s['payment'], "Interest": s['interest'],
+                         "Principal": s['principal'], "Balance": s['balance']})
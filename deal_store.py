@@ -0,0 +1,141 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from export_cache import _jsonable
+
+# ==========================================
+# PERSISTENT DEAL STORE (SQLite, WAL)
+# ==========================================
+# Inputs and outputs are stored as JSON; the columns analysts filter and sort on
+# (market, score, DCR, loan, updated time) are broken out and indexed so listing
+# tens of thousands of deals never touches the JSON blobs.
+DB_PATH = os.environ.get("MLI_DEAL_DB", "deals.db")
+PAGE_SIZE = 25
+IMPORT_BATCH = 1000
+SORTS = {'updated': 'updated_at DESC, id DESC', 'score': 'score DESC, id DESC', 'dcr': 'dcr DESC, id DESC', 'name': 'name ASC'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deals (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    market TEXT,
+    score INTEGER,
+    dcr REAL,
+    approved_loan REAL,
+    cost_base REAL,
+    updated_at TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    outputs TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_deals_market ON deals(market, updated_at DESC);
+CREATE INDEX IF NOT EXISTS idx_deals_score ON deals(score DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_deals_dcr ON deals(dcr DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_deals_updated ON deals(updated_at DESC, id DESC);
+"""
+UPSERT = """
+INSERT INTO deals (name, market, score, dcr, approved_loan, cost_base, updated_at, inputs, outputs) VALUES (?,?,?,?,?,?,?,?,?)
+ON CONFLICT(name) DO UPDATE SET market=excluded.market, score=excluded.score, dcr=excluded.dcr, approved_loan=excluded.approved_loan,
+    cost_base=excluded.cost_base, updated_at=excluded.updated_at, inputs=excluded.inputs, outputs=excluded.outputs
+"""
+
+def _dumps(o): return json.dumps(o, default=_jsonable, separators=(',', ':'))
+
+class DealStore:
+    # One shared connection per process (the app holds a single store in st.cache_resource):
+    # a lock serialises its use across session threads, writers take the database lock up
+    # front (BEGIN IMMEDIATE) and, under WAL, other processes' readers never block them.
+    def __init__(self, path=DB_PATH, busy_timeout_ms=5000):
+        self.path = path; self.busy_timeout_ms = busy_timeout_ms; self._lock = threading.RLock()
+        db = self._db = sqlite3.connect(path, timeout=busy_timeout_ms / 1000, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL"); db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}"); db.row_factory = sqlite3.Row
+        db.executescript(SCHEMA)
+
+    def _query(self, sql, args=(), one=False):
+        with self._lock:
+            cur = self._db.execute(sql, args); return cur.fetchone() if one else cur.fetchall()
+
+    @contextmanager
+    def _write(self):
+        with self._lock:
+            db = self._db; db.execute("BEGIN IMMEDIATE")
+            try: yield db
+            except BaseException: db.execute("ROLLBACK"); raise
+            else: db.execute("COMMIT")
+
+    def close(self):
+        with self._lock: self._db.close()
+
+    @staticmethod
+    def _row(name, inputs, outputs, updated_at=None):
+        return (name, outputs.get('market'), int(outputs.get('score', 0)), float(outputs.get('dcr_actual', 0)), float(outputs.get('approved_loan', 0)),
+                float(outputs.get('cost_base', 0)), updated_at or datetime.now().isoformat(timespec='seconds'), _dumps(inputs), _dumps(outputs))
+
+    def save_deal(self, name, inputs, outputs):
+        with self._write() as db:
+            db.execute(UPSERT, self._row(name, inputs, outputs))
+
+    def load_deal(self, name):
+        r = self._query("SELECT name, updated_at, inputs, outputs FROM deals WHERE name = ?", (name,), one=True)
+        return None if r is None else {'name': r['name'], 'updated_at': r['updated_at'], 'inputs': json.loads(r['inputs']), 'outputs': json.loads(r['outputs'])}
+
+    def delete_deal(self, name):
+        with self._write() as db: db.execute("DELETE FROM deals WHERE name = ?", (name,))
+
+    def _where(self, market=None, min_score=None, min_dcr=None, search=None):
+        clauses, args = [], []
+        if market: clauses.append("market = ?"); args.append(market)
+        if min_score is not None: clauses.append("score >= ?"); args.append(min_score)
+        if min_dcr is not None: clauses.append("dcr >= ?"); args.append(min_dcr)
+        if search: clauses.append("name LIKE ?"); args.append(f"%{search}%")
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), args
+
+    def list_deals(self, page=0, page_size=PAGE_SIZE, sort='updated', **filters):
+        where, args = self._where(**filters)
+        rows = self._query(f"SELECT name, market, score, dcr, approved_loan, cost_base, updated_at FROM deals{where} ORDER BY {SORTS[sort]} LIMIT ? OFFSET ?",
+                           args + [page_size, page * page_size])
+        return [dict(r) for r in rows]
+
+    def count_deals(self, **filters):
+        where, args = self._where(**filters)
+        return self._query(f"SELECT COUNT(*) FROM deals{where}", args, one=True)[0]
+
+    def markets(self):
+        return [r[0] for r in self._query("SELECT DISTINCT market FROM deals WHERE market IS NOT NULL ORDER BY market")]
+
+    def export_jsonl(self, fh):
+        # Streams every deal as one JSON object per line, a page at a time so the shared
+        # connection is never held for the whole export
+        n = 0; last = 0
+        while True:
+            rows = self._query("SELECT id, name, updated_at, inputs, outputs FROM deals WHERE id > ? ORDER BY id LIMIT ?", (last, IMPORT_BATCH))
+            if not rows: return n
+            for r in rows:
+                fh.write(f'{{"name":{json.dumps(r["name"])},"updated_at":{json.dumps(r["updated_at"])},"inputs":{r["inputs"]},"outputs":{r["outputs"]}}}\n'); n += 1
+            last = rows[-1]['id']
+
+    def import_jsonl(self, lines):
+        # Upserts in batched transactions; each batch holds the write lock only briefly.
+        # Returns (imported, rejected) where rejected lists (line number, error) for lines
+        # that are not valid deal records; those are skipped and the rest still import.
+        n = 0; batch = []; rejected = []
+        def flush():
+            with self._write() as db:
+                db.executemany(UPSERT, batch)
+            batch.clear()
+        for i, line in enumerate(lines, 1):
+            try:
+                if isinstance(line, bytes): line = line.decode('utf-8')
+                if not line.strip(): continue
+                d = json.loads(line)
+                if not isinstance(d, dict) or not isinstance(d.get('name'), str) or not isinstance(d.get('inputs'), dict) or not isinstance(d.get('outputs'), dict):
+                    raise ValueError("expected an object with name, inputs and outputs")
+                row = self._row(d['name'], d['inputs'], d['outputs'], d.get('updated_at'))
+            except (ValueError, TypeError) as e: rejected.append((i, str(e))); continue
+            batch.append(row); n += 1
+            if len(batch) >= IMPORT_BATCH: flush()
+        if batch: flush()
+        return n, rejected
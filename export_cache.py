@@ -0,0 +1,137 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+import numpy as np
+from model_graph import fingerprint
+from reports import create_advanced_pdf, create_excel_download
+from telemetry import PROCESS
+
+# ==========================================
+# CONTENT-ADDRESSED EXPORT CACHE & BACKGROUND JOBS
+# ==========================================
+CACHE_DIR = os.environ.get("MLI_EXPORT_CACHE", os.path.join(".cache", "exports"))
+CACHE_MAX_BYTES = int(float(os.environ.get("MLI_EXPORT_CACHE_MB", 512)) * 1024 * 1024)
+EXPORT_WORKERS = int(os.environ.get("MLI_EXPORT_WORKERS", 2))
+# Bump when report layout changes so stale documents are never served
+EXPORT_VERSION = 7
+
+def _jsonable(o):
+    if isinstance(o, np.generic): return o.item()
+    if isinstance(o, np.ndarray): return o.tolist()
+    return str(o)
+
+def export_key(kind, data, rent_roll_df, notes="", white_label=False, prepared_for="", rent_roll_fp=None):
+    # Reports print today's date, so it is part of the content address. The rent roll enters
+    # as its vectorized content hash (the model graph's, when passed in), never serialised.
+    payload = {'v': EXPORT_VERSION, 'kind': kind, 'date': date.today().isoformat(), 'data': data,
+               'rent_roll': rent_roll_fp or fingerprint(rent_roll_df), 'notes': notes, 'white_label': bool(white_label), 'prepared_for': prepared_for}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=_jsonable).encode('utf-8')).hexdigest()
+
+class DiskCache:
+    # Files live at root/ab/abcdef...; mtime doubles as last-access time for LRU eviction
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root; self.max_bytes = max_bytes; self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key): return os.path.join(self.root, key[:2], key)
+
+    def __contains__(self, key): return os.path.exists(self._path(key))
+
+    def get(self, key):
+        p = self._path(key)
+        try:
+            with open(p, 'rb') as f: b = f.read()
+        except FileNotFoundError: return None
+        try: os.utime(p)
+        except OSError: pass
+        return b
+
+    def put(self, key, payload):
+        p = self._path(key); os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = f"{p}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f: f.write(payload)
+        os.replace(tmp, p)
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            files = []
+            for d in os.scandir(self.root):
+                if not d.is_dir(): continue
+                for f in os.scandir(d.path):
+                    if f.name.endswith('.tmp'): continue
+                    try: info = f.stat(); files.append((info.st_mtime, info.st_size, f.path))
+                    except FileNotFoundError: pass
+            total = sum(s for _, s, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes: break
+                try: os.remove(path); total -= size
+                except FileNotFoundError: pass
+
+def render_export(kind, data, rent_roll_df, notes="", white_label=False, prepared_for=""):
+    if kind == 'pdf': return create_advanced_pdf(data, white_label, prepared_for, rent_roll_df.copy(), notes)
+    if kind == 'xlsx': return create_excel_download(data, rent_roll_df.copy())
+    raise ValueError(f"Unknown export kind: {kind}")
+
+class ExportJob:
+    def __init__(self, key, kind, future=None, expected_secs=1.0):
+        self.key = key; self.kind = kind; self.future = future; self.started = time.monotonic(); self.expected_secs = expected_secs
+        self.ready = threading.Event(); self.failure = None  # set if storing the rendered bytes fails
+        if future is None: self.ready.set()
+
+    @property
+    def status(self):
+        # Done only once the bytes are in the disk cache, not merely rendered
+        if self.ready.is_set(): return 'done'
+        if self.failure is not None or (self.future.done() and self.future.exception() is not None): return 'error'
+        if self.future.done(): return 'running'
+        return 'running' if self.future.running() else 'queued'
+
+    @property
+    def progress(self):
+        # Estimated from recent render times; never reports complete until it is
+        if self.status == 'done': return 1.0
+        return min((time.monotonic() - self.started) / max(self.expected_secs, 0.1), 0.95)
+
+    @property
+    def error(self):
+        return (self.failure or self.future.exception()) if self.status == 'error' else None
+
+class ExportService:
+    # One per server process: renders in spawned workers off the script thread and
+    # deduplicates identical requests that are already in flight.
+    def __init__(self, cache=None, workers=EXPORT_WORKERS):
+        self.cache = cache or DiskCache()
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self.jobs = {}; self.durations = {'pdf': 1.0, 'xlsx': 1.0}; self._lock = threading.Lock()
+
+    def submit(self, kind, data, rent_roll_df, notes="", white_label=False, prepared_for="", key=None):
+        key = key or export_key(kind, data, rent_roll_df, notes, white_label, prepared_for)
+        with self._lock:
+            job = self.jobs.get(key)
+            if job is not None and job.status in ('queued', 'running'): return job
+            if key in self.cache: return ExportJob(key, kind)
+            fut = self.pool.submit(render_export, kind, data, rent_roll_df, notes, white_label, prepared_for)
+            job = self.jobs[key] = ExportJob(key, kind, fut, self.durations[kind])
+        fut.add_done_callback(lambda f: self._finish(job, f))
+        return job
+
+    def _finish(self, job, fut):
+        # Every outcome leaves the in-flight table; the session keeps its own reference to report it
+        try:
+            if fut.exception() is not None: return
+            self.cache.put(job.key, fut.result()); job.ready.set()
+            # Exponential moving average of render time drives the progress estimate
+            secs = time.monotonic() - job.started; PROCESS.observe(f"export_{job.kind}_job", secs)
+            self.durations[job.kind] = 0.7 * self.durations[job.kind] + 0.3 * secs
+        except Exception as e: job.failure = e
+        finally:
+            with self._lock: self.jobs.pop(job.key, None)
+
+    def result(self, job):
+        return self.cache.get(job.key) if job.status == 'done' else None
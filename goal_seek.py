@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+from underwriting import AFF_TIERS, MIN_DCR, NOI_COMPONENTS, _out, annuity_factor, calculate_pmt, operating_income, score_rewards
+
+# ==========================================
+# GOAL SEEK: INVERT THE SIZING & SCORING RULES
+# ==========================================
+# Closed forms wherever the rule inverts directly (max cost, required NOI, units per
+# tier); the break-even rate has no closed form and is found by vectorized bisection.
+# Like underwrite(), every function broadcasts across deals.
+RATE_CEILING = 30.0  # % - upper bracket for the break-even search
+BISECT_ITERS = 60
+
+def _bisect(f, lo, hi, iters=BISECT_ITERS):
+    # f is decreasing on [lo, hi] with f(lo) >= 0 > f(hi); returns the crossing
+    lo = np.asarray(lo, dtype=float).copy(); hi = np.asarray(hi, dtype=float).copy()
+    for _ in range(iters):
+        mid = (lo + hi) / 2; above = f(mid) >= 0
+        lo = np.where(above, mid, lo); hi = np.where(above, hi, mid)
+    return lo
+
+def break_even_rate(noi, loan, amort, target_dcr=MIN_DCR, ceiling=RATE_CEILING):
+    # Highest rate (%) at which the loan still clears target_dcr. NaN if even 0% fails,
+    # inf if the deal still clears at the ceiling.
+    noi = np.asarray(noi, dtype=float); loan = np.asarray(loan, dtype=float); amort = np.asarray(amort, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        need = np.where(noi > 0, loan / (noi / target_dcr / 12), np.inf)  # annuity factor the rate must leave
+    shape = np.broadcast_shapes(need.shape, amort.shape)
+    rate = _bisect(lambda r: annuity_factor(r, amort) - need, np.zeros(shape), np.full(shape, float(ceiling)))
+    rate = np.where(annuity_factor(0.0, amort) < need, np.nan, rate)
+    return _out(np.where(annuity_factor(ceiling, amort) >= need, np.inf, rate))
+
+def max_supportable_cost(noi, interest_rate, amort, ltv, equity=None, target_dcr=MIN_DCR):
+    # Full leverage: the cost at which the LTV limit meets the DCR limit. With an equity
+    # budget: the largest cost where cost - loan(cost) <= equity.
+    loan_dcr = np.maximum(np.asarray(noi, dtype=float) / target_dcr / 12, 0) * annuity_factor(interest_rate, amort)
+    ltv = np.asarray(ltv, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        full = np.where(ltv > 0, loan_dcr / ltv, np.inf)
+        if equity is None: return _out(full)
+        equity = np.asarray(equity, dtype=float)
+        ltv_bound = np.where(ltv < 1, equity / (1 - ltv), np.inf)
+    return _out(np.where(ltv_bound <= full, ltv_bound, equity + loan_dcr))
+
+def required_noi(loan, interest_rate, amort, target_dcr=MIN_DCR):
+    # NOI at which the given loan's payments cover exactly target_dcr
+    return _out(np.asarray(calculate_pmt(loan, interest_rate, amort)) * 12 * target_dcr)
+
+def min_affordable_units(total_res, aff_count=0):
+    # Smallest affordable-unit count reaching each tier's share, and how many more are needed
+    total_res = np.asarray(total_res, dtype=float); aff_count = np.asarray(aff_count, dtype=float)
+    out = {}
+    for pct, pts in AFF_TIERS:
+        units = np.ceil(total_res * pct / 100 - 1e-9)
+        out[pts] = (_out(units), _out(np.maximum(units - aff_count, 0)))
+    return out
+
+def solve(deals, target_dcr=MIN_DCR, equity_budget=None):
+    # deals: DataFrame or mapping with cost_base, interest_rate, score and either noi or the
+    # NOI_COMPONENTS (optionally ltv, amort, approved_loan/fee, total_res, aff_count).
+    # Returns a DataFrame for DataFrame input, otherwise a dict.
+    col = lambda k: np.asarray(deals[k], dtype=float)
+    has = lambda k: k in (deals.columns if isinstance(deals, pd.DataFrame) else deals)
+    noi = col('noi') if has('noi') else np.asarray(operating_income(*[col(k) for k in NOI_COMPONENTS])['noi'])
+    cost_base = col('cost_base'); rate = col('interest_rate'); ltv, amort = score_rewards(col('score'))
+    if has('ltv'): ltv = col('ltv')
+    if has('amort'): amort = col('amort')
+    loan_ltv = cost_base * ltv
+    loan_dcr = np.maximum(noi / target_dcr / 12, 0) * annuity_factor(rate, amort)
+    # Debt service runs on the base loan, as in underwrite()
+    loan = (col('approved_loan') - (col('fee') if has('fee') else 0)) if has('approved_loan') else np.minimum(loan_ltv, loan_dcr)
+    be = break_even_rate(noi, loan, amort, target_dcr)
+    req = required_noi(loan_ltv, rate, amort, target_dcr)
+    out = {'noi': noi, 'break_even_rate': be, 'rate_headroom': np.asarray(be) - rate, 'max_cost': max_supportable_cost(noi, rate, amort, ltv, None, target_dcr),
+           'required_noi': req, 'noi_gap': np.maximum(np.asarray(req) - noi, 0)}
+    if equity_budget is not None or has('equity_budget'):
+        out['max_cost_equity'] = max_supportable_cost(noi, rate, amort, ltv, col('equity_budget') if equity_budget is None else equity_budget, target_dcr)
+    if has('total_res'):
+        for pts, (units, more) in min_affordable_units(col('total_res'), col('aff_count') if has('aff_count') else 0).items():
+            out[f'aff_units_{pts}'] = units; out[f'aff_units_{pts}_needed'] = more
+    if isinstance(deals, pd.DataFrame):
+        return pd.DataFrame({k: np.broadcast_to(v, len(deals)) for k, v in out.items()}, index=deals.index)
+    shape = np.broadcast_shapes(*[np.shape(v) for v in out.values()])
+    return {k: _out(np.broadcast_to(v, shape)) for k, v in out.items()}
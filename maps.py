@@ -0,0 +1,91 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import folium
+import pandas as pd
+import shapely
+
+# ==========================================
+# CACHED MAP RENDERING
+# ==========================================
+# Geometry is simplified once per zoom level for every CMA (one vectorized call),
+# and rendered map HTML is kept per (CMA, zoom) - or per (metric, values) for the
+# screening choropleth - in a byte-bounded LRU shared by all sessions in the process.
+ZOOM_LEVELS = (6, 9, 12)
+DEFAULT_ZOOM = 9
+NATIONAL_ZOOM = 4
+HTML_CACHE_BYTES = 64 * 1024 * 1024
+
+def zoom_tolerance(zoom):
+    # Roughly one screen pixel in degrees at this zoom (256 px tiles)
+    return 360 / (256 * 2**zoom)
+
+@lru_cache(maxsize=8)
+def _simplified_layer(index, zoom):
+    return shapely.simplify(index.geometry, zoom_tolerance(zoom), preserve_topology=True)
+
+def simplified_geometry(index, name, zoom=DEFAULT_ZOOM):
+    i = index.rows.get(name)
+    return None if i is None else _simplified_layer(index, zoom)[i]
+
+def simplified_geojson(index, name, zoom=DEFAULT_ZOOM):
+    g = simplified_geometry(index, name, zoom)
+    return None if g is None else shapely.to_geojson(g)
+
+class HtmlLRU:
+    def __init__(self, max_bytes=HTML_CACHE_BYTES):
+        self.max_bytes = max_bytes; self.nbytes = 0; self.hits = 0; self.misses = 0
+        self._items = OrderedDict(); self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None: self.misses += 1; return None
+            self._items.move_to_end(key); self.hits += 1; return item[0]
+
+    def put(self, key, html):
+        size = len(html.encode('utf-8'))
+        if size > self.max_bytes: return
+        with self._lock:
+            if key in self._items: self.nbytes -= self._items.pop(key)[1]
+            self._items[key] = (html, size); self.nbytes += size
+            while self.nbytes > self.max_bytes: self.nbytes -= self._items.popitem(last=False)[1][1]
+
+    def __len__(self): return len(self._items)
+
+MAP_CACHE = HtmlLRU()
+
+def render_market_map(index, name, zoom=DEFAULT_ZOOM, cache=MAP_CACHE):
+    key = (id(index), name, zoom)
+    html = cache.get(key)
+    if html is None:
+        d = index.lookup(name)
+        if d is None: return None
+        m = folium.Map(list(d['centroid']), zoom_start=zoom, tiles="CartoDB positron")
+        folium.GeoJson(simplified_geojson(index, name, zoom)).add_to(m)
+        html = m._repr_html_(); cache.put(key, html)
+    return html
+
+@lru_cache(maxsize=4)
+def _feature_collection(index, zoom):
+    # Serialized once; folium parses a fresh copy for each choropleth
+    feats = ','.join(f'{{"type":"Feature","id":{json.dumps(n)},"properties":{{"CMANAME":{json.dumps(n)}}},"geometry":{g}}}'
+                     for n, g in zip(index.names.tolist(), shapely.to_geojson(_simplified_layer(index, zoom))))
+    return f'{{"type":"FeatureCollection","features":[{feats}]}}'
+
+def _values_hash(values):
+    h = hashlib.blake2b(pd.util.hash_pandas_object(values, index=True).to_numpy().tobytes(), digest_size=16)
+    h.update(repr((values.index.name, str(values.dtype))).encode()); return h.hexdigest()
+
+def render_choropleth(index, values, legend, zoom=NATIONAL_ZOOM, fill_color="YlGn", cache=MAP_CACHE):
+    # values: Series indexed by CMA name
+    key = (id(index), 'choropleth', legend, zoom, fill_color, _values_hash(values))
+    html = cache.get(key)
+    if html is not None: return html
+    m = folium.Map(index.centroid[:, ::-1].mean(axis=0).tolist(), zoom_start=zoom - 1, tiles="CartoDB positron")
+    folium.Choropleth(geo_data=_feature_collection(index, zoom), data=values.rename('v').reset_index(), columns=[values.index.name or 'index', 'v'],
+                      key_on="feature.id", fill_color=fill_color, fill_opacity=0.7, line_weight=0.5, nan_fill_color="#E2E8F0", legend_name=legend).add_to(m)
+    html = m._repr_html_(); cache.put(key, html)
+    return html
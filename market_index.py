@@ -0,0 +1,92 @@
+import os
+import sys
+import numpy as np
+import shapely
+from rtree import index as rtree_index
+
+# ==========================================
+# COMPILED CMA MARKET INDEX
+# ==========================================
+# `python market_index.py` compiles app_data.geojson into a compact columnar .npz
+# (names, rent caps, centroids, bounds, simplified WKB geometry for drawing, full-resolution
+# WKB for point lookups). Loading it needs no GeoJSON parsing; the R-tree over the bounds
+# is bulk-loaded in memory.
+GEOJSON_PATH = "app_data.geojson"
+INDEX_PATH = "app_data.idx.npz"
+DEFAULT_RENT_CAP = 1550
+SIMPLIFY_TOLERANCE = 0.001  # degrees (~100 m)
+INDEX_VERSION = 2  # bump when the .npz layout changes; older files are recompiled
+# Municipalities underwritten at a neighbouring CMA's rent cap
+MARKET_ALIASES = {"Pickering": "Toronto", "Ajax": "Toronto", "Mississauga": "Toronto", "Brampton": "Toronto"}
+
+def build_market_index(src=GEOJSON_PATH, dest=INDEX_PATH, tolerance=SIMPLIFY_TOLERANCE):
+    import geopandas as gpd
+    gdf = gpd.read_file(src)
+    gdf = gdf[gdf.geometry.notna()].drop_duplicates('CMANAME', keep='first').reset_index(drop=True)
+    geoms = shapely.simplify(gdf.geometry.values, tolerance, preserve_topology=True)
+    centroids = shapely.centroid(gdf.geometry.values)
+    pack = lambda wkb: (np.frombuffer(b''.join(wkb), dtype=np.uint8), np.concatenate([[0], np.cumsum([len(b) for b in wkb])]).astype(np.int64))
+    wkb, offsets = pack(shapely.to_wkb(geoms)); wkb_full, full_offsets = pack(shapely.to_wkb(gdf.geometry.values))
+    rent = gdf['max_rent'].astype(float).to_numpy() if 'max_rent' in gdf else np.full(len(gdf), np.nan)
+    # Written beside the destination and renamed into place, so a concurrent reader (another
+    # server process or the batch CLI) never opens a half-written index
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, names=gdf['CMANAME'].astype(str).to_numpy(dtype=str), max_rent=rent,
+                                centroid=np.c_[shapely.get_x(centroids), shapely.get_y(centroids)], bounds=shapely.bounds(gdf.geometry.values),
+                                wkb=wkb, wkb_offsets=offsets, wkb_full=wkb_full, wkb_full_offsets=full_offsets, version=INDEX_VERSION)
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp): os.remove(tmp)
+    return dest
+
+class MarketIndex:
+    def __init__(self, path=INDEX_PATH):
+        with np.load(path, allow_pickle=False) as z:
+            self.names = z['names']; self.max_rent = z['max_rent']; self.centroid = z['centroid']; self.bounds = z['bounds']
+            blob = z['wkb'].tobytes(); off = z['wkb_offsets']
+            # Full-resolution shapes stay encoded; locate() decodes only the R-tree candidates
+            self._full = z['wkb_full'].tobytes(); self._full_offsets = z['wkb_full_offsets']
+        self.geometry = shapely.from_wkb([blob[off[i]:off[i + 1]] for i in range(len(self.names))])
+        self.rows = {n: i for i, n in enumerate(self.names.tolist())}
+        self.rtree = rtree_index.Index((i, tuple(b), None) for i, b in enumerate(self.bounds))
+        # Shared across sessions: freeze the arrays so no caller mutates them in place
+        for a in (self.names, self.max_rent, self.centroid, self.bounds, self.geometry, self._full_offsets): a.flags.writeable = False
+
+    def __len__(self): return len(self.names)
+
+    def rent_caps(self, default=DEFAULT_RENT_CAP):
+        return np.where(np.isnan(self.max_rent), default, self.max_rent)
+
+    def lookup(self, name):
+        i = self.rows.get(name)
+        if i is None: return None
+        rent = self.max_rent[i]
+        return {'name': name, 'row': i, 'rent_cap': DEFAULT_RENT_CAP if np.isnan(rent) else float(rent),
+                'centroid': (float(self.centroid[i, 1]), float(self.centroid[i, 0])), 'geometry': self.geometry[i]}
+
+    def locate(self, lat, lon):
+        # Point-in-polygon: R-tree bbox candidates, then an exact containment test against the
+        # unsimplified boundary so addresses near a CMA edge resolve to the right market
+        pt = shapely.Point(lon, lat); off = self._full_offsets
+        for i in self.rtree.intersection((lon, lat, lon, lat)):
+            if shapely.from_wkb(self._full[off[i]:off[i + 1]]).covers(pt): return str(self.names[i])
+        return None
+
+def _index_version(path):
+    with np.load(path, allow_pickle=False) as z:
+        return int(z['version']) if 'version' in z.files else 1
+
+def load_market_index(index_path=INDEX_PATH, src=GEOJSON_PATH):
+    # Compile on first use if only the GeoJSON ships, or if it is newer than (or in an older
+    # layout than) the index
+    if os.path.exists(src) and (not os.path.exists(index_path) or os.path.getmtime(src) > os.path.getmtime(index_path)
+                                or _index_version(index_path) != INDEX_VERSION):
+        build_market_index(src, index_path)
+    return MarketIndex(index_path) if os.path.exists(index_path) else None
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    src = args[0] if len(args) > 0 else GEOJSON_PATH; dest = args[1] if len(args) > 1 else INDEX_PATH
+    print(f"Compiled {src} -> {build_market_index(src, dest)} ({os.path.getsize(dest) / 1e6:.1f} MB)")
@@ -0,0 +1,114 @@
+import hashlib
+import time
+import altair as alt
+import numpy as np
+import pandas as pd
+from market_index import DEFAULT_RENT_CAP
+from screening import screen_markets
+from sensitivity import sensitivity_grid
+from underwriting import operating_income, rent_roll_metrics, score_rewards, underwrite
+
+# ==========================================
+# INCREMENTAL RECOMPUTE GRAPH
+# ==========================================
+# Each stage declares the inputs/stages it reads. A run pulls stages on demand and
+# reuses the previous result whenever the fingerprints of its dependencies are
+# unchanged, so moving the stress-rate slider only recomputes loan sizing onwards.
+def fingerprint(v):
+    if isinstance(v, pd.DataFrame):
+        h = hashlib.blake2b(pd.util.hash_pandas_object(v, index=True).to_numpy().tobytes(), digest_size=16)
+        h.update(repr((list(v.columns), list(v.dtypes.astype(str)))).encode()); return h.hexdigest()
+    if isinstance(v, np.ndarray): return hashlib.blake2b(v.tobytes() + repr((v.dtype, v.shape)).encode(), digest_size=16).hexdigest()
+    if isinstance(v, (str, int, float, bool, type(None), np.generic, tuple, list, dict)): return hashlib.blake2b(repr(v).encode(), digest_size=16).hexdigest()
+    return f"id:{id(v)}"  # shared resources such as the market index
+
+class ModelGraph:
+    def __init__(self): self.stages = {}
+
+    def stage(self, *deps):
+        def register(fn): self.stages[fn.__name__] = (fn, deps); return fn
+        return register
+
+    def run(self, memo):
+        return GraphRun(self, memo)
+
+class GraphRun:
+    # One per script run; memo persists across runs (e.g. in st.session_state)
+    def __init__(self, graph, memo):
+        self.graph = graph; self.memo = memo; self.values = {}; self.fps = {}; self.trace = []
+
+    def set(self, **inputs):
+        for k, v in inputs.items(): self.values[k] = v; self.fps[k] = fingerprint(v)
+
+    def __getitem__(self, name):
+        if name in self.values: return self.values[name]
+        fn, deps = self.graph.stages[name]
+        args = [self[d] for d in deps]
+        fp = hashlib.blake2b('|'.join(self.fps[d] for d in deps).encode(), digest_size=16).hexdigest()
+        t = time.perf_counter(); hit = self.memo.get(name)
+        if hit is not None and hit[0] == fp: value = hit[1]; status = 'cached'
+        else: value = fn(*args); self.memo[name] = (fp, value); status = 'computed'
+        self.values[name] = value; self.fps[name] = fp
+        self.trace.append({'Stage': name, 'Status': status, 'ms': (time.perf_counter() - t) * 1000, 'Depends On': ', '.join(deps)})
+        return value
+
+MODEL = ModelGraph()
+
+@MODEL.stage('market_index', 'cma')
+def market(index, cma):
+    return index.lookup(cma) if index is not None else None
+
+@MODEL.stage('market')
+def rent_cap(market):
+    return market['rent_cap'] if market is not None else DEFAULT_RENT_CAP
+
+@MODEL.stage('rent_roll', 'rent_cap')
+def affordability(rent_roll, rent_cap):
+    rr = rent_roll_metrics(rent_roll['Unit Type'], rent_roll['Count'], rent_roll['Rent ($)'], rent_cap)
+    return {**rr, 'total_res': int(rr['total_res']), 'pts_aff': int(rr['pts_aff'])}
+
+@MODEL.stage('affordability', 'pts_aff_manual', 'pts_nrg', 'pts_acc')
+def score(affordability, pts_aff_manual, pts_nrg, pts_acc):
+    pts_aff = affordability['pts_aff'] if pts_aff_manual is None else pts_aff_manual
+    return {'pts_aff': pts_aff, 'pts_nrg': pts_nrg, 'pts_acc': pts_acc, 'score': pts_aff + pts_nrg + pts_acc}
+
+@MODEL.stage('score')
+def rewards(score):
+    ltv, amort = score_rewards(score['score'])
+    return {"ltv": float(ltv), "amort": int(amort)}
+
+@MODEL.stage('affordability', 'vacancy', 'mgmt', 'tax', 'ins', 'util', 'rm', 'reserves')
+def noi(affordability, vacancy, mgmt, tax, ins, util, rm, reserves):
+    return operating_income(affordability['potential_inc'], vacancy, mgmt, tax, ins, util, rm, reserves)
+
+@MODEL.stage('noi', 'tax', 'ins', 'util', 'rm', 'reserves')
+def expense_chart(noi, tax, ins, util, rm, reserves):
+    return alt.Chart(pd.DataFrame({'Cat': ['Tax', 'Ins', 'Util', 'R&M', 'Rsrv', 'Mgmt'], 'Val': [tax, ins, util, rm, reserves, noi['mgmt_amt']]})).mark_arc(innerRadius=60).encode(theta='Val', color='Cat', tooltip=['Cat', 'Val'])
+
+@MODEL.stage('cost_base', 'noi', 'stress_rate', 'score', 'rewards')
+def loan(cost_base, noi, stress_rate, score, rewards):
+    return underwrite({'cost_base': cost_base, 'noi': noi['noi'], 'interest_rate': stress_rate, 'score': score['score'], 'ltv': rewards['ltv'], 'amort': rewards['amort']})
+
+@MODEL.stage('loan')
+def loan_chart(loan):
+    return alt.Chart(pd.DataFrame({'Limit': ['Max LTV', 'Max DCR', 'Final Loan'], 'Value': [loan['loan_ltv'], loan['loan_dcr'], loan['approved']], 'Color': ['#CBD5E1', '#CBD5E1', '#10B981']})).mark_bar().encode(x='Limit', y='Value', color=alt.Color('Color', scale=None), tooltip=['Limit', 'Value']).properties(height=200)
+
+@MODEL.stage('project_name', 'cma', 'rent_cap', 'affordability', 'score', 'noi', 'loan', 'rewards', 'vacancy', 'mgmt', 'tax', 'ins', 'util', 'rm', 'reserves', 'cost_base', 'stress_rate')
+def report_data(project_name, cma, rent_cap, affordability, score, noi, loan, rewards, vacancy, mgmt, tax, ins, util, rm, reserves, cost_base, stress_rate):
+    return {
+        'project_name': project_name, 'market': cma, 'rent_cap': rent_cap,
+        'score': score['score'], 'approved_loan': loan['approved_loan'], 'equity': loan['equity'], 'noi': noi['noi'], 'cap_rate': loan['cap_rate'],
+        'ltc': loan['ltc'], 'coc_return': loan['coc_return'], 'dcr_actual': loan['dcr_actual'],
+        'pts_aff': score['pts_aff'], 'aff_pct': affordability['aff_pct'], 'pts_nrg': score['pts_nrg'], 'pts_acc': score['pts_acc'], 'vacancy': vacancy,
+        'annual_debt_svc': loan['annual_debt_svc'], 'cost_base': cost_base, 'interest_rate': stress_rate,
+        'ex_tax': tax, 'ex_ins': ins, 'ex_util': util, 'ex_rm': rm, 'ex_res': reserves, 'amort': rewards['amort'],
+        'potential_inc': affordability['potential_inc'], 'mgmt': mgmt, 'fee': loan['fee']
+    }
+
+@MODEL.stage('report_data')
+def sensitivity(report_data):
+    return sensitivity_grid(report_data)
+
+@MODEL.stage('market_index', 'rent_roll', 'report_data', 'alias_map')
+def market_screen(index, rent_roll, report_data, alias_map):
+    return screen_markets(index, rent_roll, report_data, alias_map)
@@ -0,0 +1,74 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+from underwriting import residential_mask
+
+# ==========================================
+# UNIT-LEVEL RENT ROLL INGESTION
+# ==========================================
+# Accepts either a unit-mix table (Unit Type, Count, Rent) or a unit-level export with
+# one row per suite, in which case Count defaults to 1. Header spellings from common
+# property-management exports are mapped onto the app's column names. A blank rent
+# (usually a vacant suite) is kept as NaN: the unit counts, but never as affordable. A
+# blank unit type becomes UNSPECIFIED_TYPE and counts as residential; only rows with no
+# type, rent or unit at all are dropped.
+RENT_ROLL_COLUMNS = ['Unit Type', 'Count', 'Rent ($)']
+UNSPECIFIED_TYPE = 'Unspecified'
+COLUMN_ALIASES = {
+    'unit': 'Unit', 'unit #': 'Unit', 'unit no': 'Unit', 'unit number': 'Unit', 'unit id': 'Unit', 'suite': 'Unit',
+    'unit type': 'Unit Type', 'type': 'Unit Type', 'floorplan': 'Unit Type', 'floor plan': 'Unit Type', 'bedrooms': 'Unit Type',
+    'count': 'Count', 'units': 'Count', 'qty': 'Count', 'quantity': 'Count',
+    'rent ($)': 'Rent ($)', 'rent': 'Rent ($)', 'monthly rent': 'Rent ($)', 'current rent': 'Rent ($)', 'contract rent': 'Rent ($)', 'market rent': 'Rent ($)',
+}
+
+def _canonical(name):
+    return COLUMN_ALIASES.get(re.sub(r'\s+', ' ', str(name).strip().lower()))
+
+def _numeric(s):
+    # Exports often carry "$1,450.00"; strip formatting before the typed conversion
+    if not pd.api.types.is_numeric_dtype(s): s = s.astype(str).str.replace(r'[$,\s]', '', regex=True)
+    return pd.to_numeric(s, errors='coerce')
+
+def read_rent_roll(src, name=None):
+    # src is a path or a file-like object (name then gives the extension). Only the
+    # recognised columns are read, and each is converted to its final dtype in one pass.
+    ext = os.path.splitext(name or str(src))[1].lower(); keep = lambda c: _canonical(c) is not None
+    if ext in ('.csv', '.txt'): df = pd.read_csv(src, usecols=keep, dtype=str)
+    elif ext == '.xlsx': df = pd.read_excel(src, usecols=keep, engine='openpyxl')
+    elif ext in ('.parquet', '.pq'):
+        import pyarrow.parquet as pq
+        f = pq.ParquetFile(src); df = f.read(columns=[c for c in f.schema_arrow.names if keep(c)]).to_pandas()
+    else: raise ValueError(f"Unsupported rent roll file type: {ext}")
+    df = df.rename(columns=_canonical)
+    df = df.loc[:, ~df.columns.duplicated()]
+    missing = [c for c in ('Unit Type', 'Rent ($)') if c not in df]
+    if missing: raise ValueError(f"Rent roll is missing {', '.join(missing)} (found: {', '.join(df.columns) or 'no recognised columns'})")
+    blank = lambda s: s.isna().to_numpy() | (s.astype(str).str.strip() == '').to_numpy()
+    types = df['Unit Type'].astype(str).str.strip().mask(blank(df['Unit Type']), UNSPECIFIED_TYPE)
+    out = pd.DataFrame({'Unit Type': types.astype('category'),
+                        'Count': _numeric(df['Count']).fillna(1).astype('int32') if 'Count' in df else np.ones(len(df), dtype='int32'),
+                        'Rent ($)': _numeric(df['Rent ($)']).astype('float64')})
+    if 'Unit' in df: out.insert(0, 'Unit', df['Unit'].astype(str))
+    empty = blank(df['Unit Type']) & out['Rent ($)'].isna().to_numpy() & (blank(df['Unit']) if 'Unit' in df else True)
+    return out[~empty].reset_index(drop=True)
+
+def blank_rent_units(rent_roll_df):
+    # Units whose rent is missing; shown with the import so the count is never a surprise
+    return int(rent_roll_df['Count'].to_numpy(dtype=float)[np.isnan(rent_roll_df['Rent ($)'].to_numpy(dtype=float))].sum())
+
+def unspecified_type_units(rent_roll_df):
+    # Units imported with a blank unit type (counted as residential)
+    return int(rent_roll_df['Count'].to_numpy(dtype=float)[(rent_roll_df['Unit Type'].astype(str) == UNSPECIFIED_TYPE).to_numpy()].sum())
+
+def summarize_rent_roll(rent_roll_df, rent_cap):
+    # Unit mix by type: units, units with no rent, average rent over the units that have
+    # one and units at or below the cap
+    counts = rent_roll_df['Count'].to_numpy(dtype=float); rents = rent_roll_df['Rent ($)'].to_numpy(dtype=float); blank = np.isnan(rents)
+    aff = residential_mask(rent_roll_df['Unit Type']) & (rents <= rent_cap)
+    g = pd.DataFrame({'Unit Type': rent_roll_df['Unit Type'].astype(str).to_numpy(), 'Units': counts, 'No Rent': counts * blank, 'Affordable': counts * aff,
+                      'Monthly Rent': counts * np.nan_to_num(rents)})
+    g = g.groupby('Unit Type', sort=True).sum()
+    rented = g['Units'] - g['No Rent']
+    g.insert(2, 'Avg Rent', np.where(rented > 0, g['Monthly Rent'] / rented.where(rented > 0, 1), 0))
+    return g.astype({'Units': int, 'No Rent': int, 'Affordable': int}).reset_index()
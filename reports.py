@@ -0,0 +1,158 @@
+from datetime import datetime
+import io
+import numpy as np
+import pandas as pd
+from fpdf import FPDF
+from sensitivity import DCR_TOL, sensitivity_grid, dcr_frontier, dcr_matrix, frontier_labels, rate_stress
+from cashflow import HOLD_YEARS, amortization_table, cash_flow_projection, pro_forma_table
+from underwriting import MIN_DCR, residential_mask
+
+# ==========================================
+# INVESTOR PDF & EXCEL MODEL EXPORTS
+# ==========================================
+DISCLAIMER_TEXT = "LEGAL DISCLAIMER: This model is for educational purposes only. Users must verify all CMHC criteria, rent caps, and underwriting assumptions with a qualified lender."
+
+def create_excel_download(data, rent_roll_df):
+    output = io.BytesIO(); proj = cash_flow_projection(data)
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        
+        # TAB 1: EXECUTIVE SUMMARY
+        summary_data = {
+            "Metric": ["Project Name", "Market", "Underwritten Date", "", "Total Project Cost", "Approved Loan Amount", "Equity Required", "Loan-to-Cost (LTC)", "", "Net Operating Income (NOI)", "Debt Coverage Ratio (DCR)", "Going-In Cap Rate", "Cash-on-Cash Return", "", "MLI Select Total Score", "Amortization Period", "Underwritten Interest Rate", "", f"Levered IRR ({HOLD_YEARS}-Yr Hold)", f"Refinance Proceeds (Yr {HOLD_YEARS})"],
+            "Value": [data['project_name'], data['market'], datetime.now().strftime('%Y-%m-%d'), "", f"${data['cost_base']:,.0f}", f"${data['approved_loan']:,.0f}", f"${data['equity']:,.0f}", f"{data['ltc']:.1f}%", "", f"${data['noi']:,.0f}", f"{data['dcr_actual']:.2f}x", f"{data['cap_rate']:.2f}%", f"{data['coc_return']:.2f}%", "", data['score'], f"{data['amort']} Years", f"{data['interest_rate']}%", "", "n/a" if np.isnan(proj['irr']) else f"{proj['irr']:.1f}%", f"${proj['refi_proceeds'][-1]:,.0f}"]
+        }
+        pd.DataFrame(summary_data).to_excel(writer, sheet_name='Executive Summary', index=False)
+        
+        # TAB 2: INPUTS
+        inputs_data = {"Category": ["Scoring", "Scoring", "Scoring", "Scoring", "Market", "Market", "Market", "Expenses", "Expenses", "Expenses", "Expenses", "Expenses", "Expenses", "Expenses"], "Item": ["Affordability Points", "Energy Efficiency Points", "Accessibility Points", "Total Score", "CMHC Rent Cap Used", "Residential Units", "Affordable Units %", "Vacancy Rate Used", "Mgmt Fee %", "Property Taxes", "Insurance", "Utilities", "Maintenance (R&M)", "Replacement Reserves"], "Value": [data['pts_aff'], data['pts_nrg'], data['pts_acc'], data['score'], f"${data['rent_cap']:,.0f}", int(rent_roll_df['Count'][residential_mask(rent_roll_df['Unit Type'])].sum()), f"{data['aff_pct']:.1f}%", f"{data['vacancy']}%", f"{data['mgmt']}%", f"${data['ex_tax']:,.0f}", f"${data['ex_ins']:,.0f}", f"${data['ex_util']:,.0f}", f"${data['ex_rm']:,.0f}", f"${data['ex_res']:,.0f}"]}
+        pd.DataFrame(inputs_data).to_excel(writer, sheet_name='Inputs & Assumptions', index=False)
+        
+        # TAB 3: RENT ROLL
+        rent_roll_df.to_excel(writer, sheet_name='Rent Roll', index=False)
+        
+        # TAB 4: PRO FORMA (per-line growth, monthly amortization rolled up by year) + FULL SCHEDULE
+        pro_forma_table(proj).round(2).to_excel(writer, sheet_name='10-Year Pro Forma', index=False)
+        amortization_table(data).round(2).to_excel(writer, sheet_name='Amortization', index=False)
+        
+        # TAB 5: STRESS TEST
+        stress = rate_stress(data); stress['Rate'] = stress['Rate'].map(lambda r: f"{r:.2f}%")
+        stress.to_excel(writer, sheet_name='Stress Test', index=False)
+        
+        # TAB 6: SENSITIVITY GRID (DCR by rate x vacancy at underwritten opex) + PASS/FAIL FRONTIER
+        grid = sensitivity_grid(data)
+        dcr_matrix(grid).round(3).to_excel(writer, sheet_name='Sensitivity Grid')
+        frontier_labels(dcr_frontier(grid), grid['rates']).to_excel(writer, sheet_name='DCR Frontier')
+    return output.getvalue()
+
+# --- PDF ENGINE ---
+class PDF(FPDF):
+    def header(self):
+        self.set_font('Arial', 'B', 10); self.set_text_color(150, 150, 150); self.cell(0, 10, 'MLI Select Pro Analysis', 0, 1, 'R'); self.ln(5)
+    def footer(self):
+        self.set_y(-15); self.set_font('Arial', 'I', 8); self.set_text_color(150, 150, 150); self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+    def watermark(self, text="DRAFT / UNAUDITED"):
+        self.set_font('Arial', 'B', 40); self.set_text_color(240, 240, 240); self.text(30, 150, text)
+
+APPENDIX_BATCH = 500
+ROW_H = 6
+APPENDIX_COLS = [("Unit", 70, 'L'), ("Count", 20, 'C'), ("Rent", 30, 'R'), ("Total", 35, 'R'), ("Affordable", 35, 'C')]
+
+def _appendix_rows(rent_roll_df, rent_cap, batch=APPENDIX_BATCH):
+    # Formats the rent roll a batch at a time so large unit-level rolls are never
+    # materialised as strings all at once; yields (cells, units, monthly total)
+    for i in range(0, len(rent_roll_df), batch):
+        c = rent_roll_df.iloc[i:i + batch]
+        counts = c['Count'].to_numpy(dtype=float); rents = c['Rent ($)'].to_numpy(dtype=float); totals = counts * np.nan_to_num(rents)
+        aff = np.where(residential_mask(c['Unit Type']), np.where(rents <= rent_cap, "Yes", "No"), "n/a")
+        label = c['Unit Type'].astype(str) if 'Unit' not in c else c['Unit'].astype(str) + " - " + c['Unit Type'].astype(str)
+        money = lambda v: (f"${x:,.0f}" if x == x else "No rent" for x in v)
+        cells = zip(label.str.slice(0, 40), (f"{n:,.0f}" for n in counts), money(rents), (f"${t:,.0f}" for t in totals), aff)
+        yield from zip(cells, counts, totals)
+
+def _appendix_header(pdf, is_white_label, cont=False):
+    if not is_white_label: pdf.watermark()
+    pdf.set_text_color(0, 0, 0); pdf.set_font('Arial', 'B', 14); pdf.cell(0, 10, "Appendix A: Rent Roll" + (" (cont.)" if cont else ""), ln=1); pdf.line(10, pdf.get_y(), 200, pdf.get_y()); pdf.ln(5)
+    pdf.set_fill_color(220, 220, 220); pdf.set_font('Arial', 'B', 9)
+    for h, w, al in APPENDIX_COLS: pdf.cell(w, ROW_H + 2, h, 1, 0, al, 1)
+    pdf.ln(); pdf.set_font('Arial', '', 8)
+
+def _total_row(pdf, label, units, total):
+    pdf.set_fill_color(240, 244, 248); pdf.set_font('Arial', 'B', 8)
+    pdf.cell(APPENDIX_COLS[0][1], ROW_H, label, 1, 0, 'L', 1); pdf.cell(APPENDIX_COLS[1][1], ROW_H, f"{units:,.0f}", 1, 0, 'C', 1)
+    pdf.cell(APPENDIX_COLS[2][1], ROW_H, "", 1, 0, 'R', 1); pdf.cell(APPENDIX_COLS[3][1], ROW_H, f"${total:,.0f}", 1, 0, 'R', 1); pdf.cell(APPENDIX_COLS[4][1], ROW_H, "", 1, 1, 'C', 1)
+    pdf.set_font('Arial', '', 8)
+
+def _rent_roll_appendix(pdf, rent_roll_df, rent_cap, is_white_label):
+    # Explicit pagination: every page repeats the header and closes with a subtotal,
+    # and the last page carries the grand total
+    auto, margin = pdf.auto_page_break, pdf.b_margin; pdf.set_auto_page_break(False)
+    bottom = pdf.h - 20 - 2 * ROW_H; page_units = page_total = all_units = all_total = 0.0
+    pdf.add_page(); _appendix_header(pdf, is_white_label); first = pdf.page_no()
+    for cells, units, total in _appendix_rows(rent_roll_df, rent_cap):
+        if pdf.get_y() + ROW_H > bottom:
+            _total_row(pdf, "Page Subtotal", page_units, page_total); page_units = page_total = 0.0
+            pdf.add_page(); _appendix_header(pdf, is_white_label, cont=True)
+        for text, (_, w, al) in zip(cells, APPENDIX_COLS): pdf.cell(w, ROW_H, text, 1, 0, al)
+        pdf.ln(); page_units += units; page_total += total; all_units += units; all_total += total
+    if pdf.page_no() > first: _total_row(pdf, "Page Subtotal", page_units, page_total)
+    _total_row(pdf, "Total", all_units, all_total)
+    pdf.set_auto_page_break(auto, margin)
+
+def create_advanced_pdf(data, is_white_label, prepared_for, rent_roll_df, deal_notes):
+    pdf = PDF()
+    
+    # Page 1: Executive Summary
+    pdf.add_page()
+    if not is_white_label: pdf.watermark()
+    pdf.set_font('Arial', 'B', 24); pdf.set_text_color(33, 33, 33); pdf.cell(0, 15, data['project_name'], ln=1)
+    pdf.set_font('Arial', '', 11); pdf.cell(0, 8, f"Market: {data['market']} | Date: {datetime.now().strftime('%Y-%m-%d')}", ln=1)
+    if is_white_label: pdf.cell(0, 8, f"Prepared For: {prepared_for}", ln=1)
+    pdf.ln(10); pdf.set_fill_color(240, 244, 248); pdf.rect(10, 50, 190, 45, 'F'); pdf.set_xy(15, 55); pdf.set_font('Arial', 'B', 14); pdf.cell(60, 10, "Approved Loan"); pdf.cell(60, 10, "Total Score"); pdf.cell(60, 10, "Equity Required", ln=1)
+    pdf.set_xy(15, 65); pdf.set_font('Arial', 'B', 18); pdf.cell(60, 15, f"${data['approved_loan']:,.0f}"); pdf.cell(60, 15, f"{data['score']} Pts"); pdf.cell(60, 15, f"${data['equity']:,.0f}", ln=1)
+    pdf.ln(25); pdf.set_text_color(0, 0, 0); pdf.set_font('Arial', 'B', 14); pdf.cell(0, 10, "Financial Snapshot", ln=1); pdf.line(10, pdf.get_y(), 200, pdf.get_y()); pdf.ln(5); metrics = [("NOI", f"${data['noi']:,.0f}"), ("Cap Rate", f"{data['cap_rate']:.2f}%"), ("DCR", f"{data['dcr_actual']:.2f}x"), ("Cash-on-Cash", f"{data['coc_return']:.2f}%"), ("LTC", f"{data['ltc']:.1f}%")]; pdf.set_font('Arial', '', 12)
+    for l, v in metrics: pdf.cell(120, 8, l, 0); pdf.cell(60, 8, v, 0, 1, 'R')
+    if deal_notes: pdf.ln(10); pdf.set_font('Arial', 'B', 12); pdf.cell(0, 10, "Underwriter Notes", ln=1); pdf.set_font('Arial', '', 10); pdf.multi_cell(0, 6, deal_notes)
+    
+    # Page 2: Pro Forma & Sensitivity
+    pdf.add_page()
+    if not is_white_label: pdf.watermark()
+    proj = cash_flow_projection(data)
+    pdf.set_font('Arial', 'B', 14); pdf.cell(0, 10, "10-Year Pro Forma", ln=1); pdf.line(10, pdf.get_y(), 200, pdf.get_y()); pdf.ln(5); pdf.set_fill_color(220, 220, 220); pdf.set_font('Arial', 'B', 9)
+    cols = [("Year", 15), ("NOI", 30), ("Debt Service", 30), ("Principal", 28), ("Cash Flow", 30), ("DCR", 20), ("Loan Balance", 37)]
+    for h, w in cols: pdf.cell(w, 8, h, 1, 0, 'C', 1)
+    pdf.ln(); pdf.set_font('Arial', '', 9)
+    for _, y in pro_forma_table(proj).iterrows():
+        pdf.cell(15, 8, str(int(y['Year'])), 1, 0, 'C'); pdf.cell(30, 8, f"{y['Net Operating Income (NOI)']:,.0f}", 1, 0, 'R'); pdf.cell(30, 8, f"{y['Annual Debt Service']:,.0f}", 1, 0, 'R'); pdf.cell(28, 8, f"{y['Principal']:,.0f}", 1, 0, 'R')
+        pdf.cell(30, 8, f"{y['Cash Flow']:,.0f}", 1, 0, 'R'); pdf.cell(20, 8, f"{y['DCR']:.2f}x", 1, 0, 'C'); pdf.cell(37, 8, f"{y['Loan Balance']:,.0f}", 1, 1, 'R')
+    pdf.ln(3); pdf.set_font('Arial', 'B', 9)
+    pdf.cell(0, 6, f"Levered IRR ({HOLD_YEARS}-yr hold): {'n/a' if np.isnan(proj['irr']) else format(proj['irr'], '.1f') + '%'}  |  Equity Buildup: ${proj['equity_buildup'][-1]:,.0f}  |  Refinance Proceeds (Yr {HOLD_YEARS}): ${proj['refi_proceeds'][-1]:,.0f}", ln=1)
+    pdf.ln(10); pdf.set_font('Arial', 'B', 14); pdf.cell(0, 10, "Interest Rate Sensitivity", ln=1); pdf.line(10, pdf.get_y(), 200, pdf.get_y()); pdf.ln(5); pdf.set_fill_color(220, 220, 220); pdf.set_font('Arial', 'B', 9); pdf.cell(40, 8, "Rate", 1, 0, 'C', 1); pdf.cell(50, 8, "Payment", 1, 0, 'C', 1); pdf.cell(40, 8, "DCR", 1, 1, 'C', 1); pdf.set_font('Arial', '', 9)
+    for _, s in rate_stress(data).iterrows():
+        pdf.cell(40, 8, f"{s['Rate']:.2f}%", 1, 0, 'C'); pdf.cell(50, 8, f"${s['Payment']:,.0f}", 1, 0, 'C'); pdf.set_text_color(220, 53, 69) if s['Status'] == 'FAIL' else pdf.set_text_color(0, 0, 0); pdf.cell(40, 8, f"{s['DCR']:.2f}x", 1, 1, 'C'); pdf.set_text_color(0, 0, 0)
+    
+    # Page 3: DCR Sensitivity Grid (25bp rows) & Pass/Fail Frontier
+    pdf.add_page()
+    if not is_white_label: pdf.watermark()
+    grid = sensitivity_grid(data); mat = dcr_matrix(grid).iloc[::5]
+    pdf.set_font('Arial', 'B', 14); pdf.cell(0, 10, "DCR Sensitivity Grid (Rate x Vacancy)", ln=1); pdf.line(10, pdf.get_y(), 200, pdf.get_y()); pdf.ln(5)
+    cw = 170 / len(mat.columns); pdf.set_fill_color(220, 220, 220); pdf.set_font('Arial', 'B', 7); pdf.cell(20, 6, "Rate / Vac", 1, 0, 'C', 1)
+    for v in mat.columns: pdf.cell(cw, 6, f"{v:g}%", 1, 0, 'C', 1)
+    pdf.ln(); pdf.set_font('Arial', '', 7)
+    for r, row in mat.iterrows():
+        pdf.set_fill_color(220, 220, 220); pdf.cell(20, 6, f"{r:.2f}%", 1, 0, 'C', 1)
+        for dcr in row: pdf.set_fill_color(*((209, 250, 229) if dcr >= MIN_DCR - DCR_TOL else (254, 226, 226))); pdf.cell(cw, 6, f"{dcr:.2f}", 1, 0, 'C', 1)
+        pdf.ln()
+    pdf.ln(8); pdf.set_font('Arial', 'B', 14); pdf.cell(0, 10, "DCR Pass/Fail Frontier (Max Rate at 1.10x)", ln=1); pdf.line(10, pdf.get_y(), 200, pdf.get_y()); pdf.ln(5)
+    front = frontier_labels(dcr_frontier(grid), grid['rates'], ge=">="); pdf.set_fill_color(220, 220, 220); pdf.set_font('Arial', 'B', 8); pdf.cell(30, 6, "Vacancy", 1, 0, 'C', 1)
+    for o in front.columns: pdf.cell(30, 6, f"OpEx +{o:g}%", 1, 0, 'C', 1)
+    pdf.ln(); pdf.set_font('Arial', '', 8)
+    for v, row in front.iterrows():
+        pdf.cell(30, 6, f"{v:g}%", 1, 0, 'C')
+        for r in row: pdf.cell(30, 6, r, 1, 0, 'C')
+        pdf.ln()
+    
+    # Page 4+: Rent Roll (paginated, with page subtotals)
+    _rent_roll_appendix(pdf, rent_roll_df, data['rent_cap'], is_white_label)
+    if pdf.get_y() > pdf.h - 45: pdf.add_page()
+    pdf.set_y(-40); pdf.set_font('Arial', 'I', 8); pdf.set_text_color(0, 0, 0); pdf.multi_cell(0, 5, DISCLAIMER_TEXT)
+    return pdf.output(dest='S').encode('latin-1')
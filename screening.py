@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+from underwriting import operating_income, rent_roll_metrics, underwrite
+
+# ==========================================
+# MARKET SCREENING: ONE DEAL TEMPLATE x EVERY CMA
+# ==========================================
+def market_table(index, alias_map=None):
+    # One row per CMA plus one per alias, each pointing at the CMA whose rent cap applies
+    alias_map = alias_map or {}
+    names = index.names.tolist(); caps = index.rent_caps()
+    aliases = [(a, c) for a, c in alias_map.items() if c in index.rows and a not in index.rows]
+    return pd.DataFrame({'Market': names + [a for a, _ in aliases], 'CMA': names + [c for _, c in aliases],
+                         'Rent Cap': np.concatenate([caps, [caps[index.rows[c]] for _, c in aliases]])})
+
+def screen_markets(index, rent_roll_df, template, alias_map=None):
+    # template: cost_base, interest_rate, vacancy, mgmt, ex_* expenses and the
+    # non-affordability points (pts_nrg, pts_acc). Affordability is always auto-scored.
+    mk = market_table(index, alias_map)
+    rr = rent_roll_metrics(rent_roll_df['Unit Type'], rent_roll_df['Count'], rent_roll_df['Rent ($)'], mk['Rent Cap'].to_numpy())
+    noi = operating_income(rr['potential_inc'], template['vacancy'], template['mgmt'], template['ex_tax'], template['ex_ins'], template['ex_util'], template['ex_rm'], template['ex_res'])['noi']
+    score = rr['pts_aff'] + template.get('pts_nrg', 0) + template.get('pts_acc', 0)
+    uw = underwrite({'cost_base': np.full(len(mk), float(template['cost_base'])), 'noi': noi, 'interest_rate': template['interest_rate'], 'score': score})
+    out = mk.assign(**{'Affordable %': rr['aff_pct'], 'Affordability Pts': rr['pts_aff'], 'Total Score': score, 'LTV': uw['ltv'] * 100,
+                       'Amortization': uw['amort'], 'Approved Loan': uw['approved'], 'Equity': uw['equity'], 'DCR': uw['dcr_actual'], 'Cash-on-Cash %': uw['coc_return']})
+    return out.sort_values(['Total Score', 'Approved Loan'], ascending=False, ignore_index=True)
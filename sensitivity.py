@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from underwriting import MIN_DCR, calculate_pmt
+
+# ==========================================
+# RATE x VACANCY x OPEX SENSITIVITY GRID
+# ==========================================
+# One broadcasted pass: rates on axis 0, vacancy on axis 1, opex shock on axis 2.
+RATE_STEP = 0.05
+DEFAULT_VACANCIES = np.arange(0.0, 15.5, 1.0)
+DEFAULT_OPEX_SHOCKS = np.array([0.0, 5.0, 10.0, 15.0, 20.0])
+DCR_TOL = 1e-9  # DCR-sized loans sit exactly on the limit; keep round-off from failing them
+
+def rate_axis(base_rate, below=1.0, above=2.0, step=RATE_STEP):
+    # Snap to whole basis points so grid labels stay clean
+    return np.round(np.arange(base_rate - below, base_rate + above + step / 2, step), 4).clip(min=0)
+
+def sensitivity_grid(data, rates=None, vacancies=None, opex_shocks=None):
+    # data: the pdf_data dict (needs approved_loan, amort, interest_rate, potential_inc,
+    # vacancy, mgmt and the ex_* expense lines). Loan is held at the approved amount; as in
+    # underwrite(), payments run on the base loan (approved_loan - fee).
+    rates = rate_axis(data['interest_rate']) if rates is None else np.asarray(rates, dtype=float)
+    vacancies = DEFAULT_VACANCIES if vacancies is None else np.asarray(vacancies, dtype=float)
+    opex_shocks = DEFAULT_OPEX_SHOCKS if opex_shocks is None else np.asarray(opex_shocks, dtype=float)
+    fixed_opex = data['ex_tax'] + data['ex_ins'] + data['ex_util'] + data['ex_rm'] + data['ex_res']
+    debt = np.asarray(calculate_pmt(data['approved_loan'] - data.get('fee', 0), rates, data['amort'])) * 12
+    egi = data['potential_inc'] * (1 - vacancies / 100)
+    noi = (egi * (1 - data['mgmt'] / 100))[None, :, None] - fixed_opex * (1 + opex_shocks / 100)[None, None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dcr = np.where(debt[:, None, None] > 0, noi / debt[:, None, None], 0)
+    return {'rates': rates, 'vacancies': vacancies, 'opex_shocks': opex_shocks, 'debt': debt, 'noi': noi[0], 'dcr': dcr}
+
+def dcr_frontier(grid, min_dcr=MIN_DCR):
+    # Highest rate that still clears min_dcr for each (vacancy, opex shock); DCR falls
+    # monotonically with rate, so it is the last passing index along the rate axis.
+    # NaN where even the lowest rate fails; inf where the top rate still passes (no crossing
+    # on the grid, so the true frontier lies above it).
+    passing = grid['dcr'] >= min_dcr - DCR_TOL
+    n_pass = passing.sum(axis=0)
+    frontier = np.where(n_pass > 0, grid['rates'][np.maximum(n_pass - 1, 0)], np.nan)
+    frontier = np.where(n_pass == len(grid['rates']), np.inf, frontier)
+    return pd.DataFrame(frontier, index=pd.Index(grid['vacancies'], name='Vacancy %'), columns=pd.Index(grid['opex_shocks'], name='OpEx Shock %'))
+
+def frontier_labels(frontier, rates, ge="≥"):
+    # Display text for dcr_frontier(): FAIL, the rate, or "≥ top rate" past the grid edge
+    top = float(np.max(rates))
+    return frontier.map(lambda r: "FAIL" if np.isnan(r) else f"{ge} {top:.2f}%" if np.isinf(r) else f"{r:.2f}%")
+
+def grid_frame(grid, min_dcr=MIN_DCR):
+    # Long format for charts and exports
+    r, v, o = np.meshgrid(grid['rates'], grid['vacancies'], grid['opex_shocks'], indexing='ij')
+    dcr = grid['dcr'].ravel()
+    return pd.DataFrame({'Rate': r.ravel(), 'Vacancy %': v.ravel(), 'OpEx Shock %': o.ravel(), 'Payment': np.broadcast_to(grid['debt'][:, None, None], r.shape).ravel(),
+                         'DCR': dcr, 'Status': np.where(dcr >= min_dcr - DCR_TOL, 'PASS', 'FAIL')})
+
+def dcr_matrix(grid, opex_shock=0.0):
+    # Rate rows x vacancy columns at one opex shock
+    k = int(np.abs(grid['opex_shocks'] - opex_shock).argmin())
+    return pd.DataFrame(grid['dcr'][:, :, k], index=pd.Index(grid['rates'], name='Rate %'), columns=pd.Index(grid['vacancies'], name='Vacancy %'))
+
+def rate_stress(data, offsets=(-0.5, 0.0, 0.5, 1.0, 1.5)):
+    # Classic five-row rate table at the underwritten vacancy and expenses
+    g = sensitivity_grid(data, rates=np.asarray(offsets) + data['interest_rate'], vacancies=[data['vacancy']], opex_shocks=[0.0])
+    dcr = g['dcr'][:, 0, 0]
+    return pd.DataFrame({'Rate': g['rates'], 'Payment': g['debt'], 'DCR': dcr, 'Status': np.where(dcr >= MIN_DCR - DCR_TOL, 'PASS', 'FAIL')})
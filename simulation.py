@@ -0,0 +1,69 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from underwriting import MIN_DCR
+
+# ==========================================
+# 10-YEAR PRO FORMA: MONTE CARLO
+# ==========================================
+# (mean, std dev) per year unless noted; rates in %, renewal as a share of units
+DEFAULT_ASSUMPTIONS = {
+    'rent_growth': (2.0, 1.5),
+    'vacancy_sd': 1.5,
+    'expense_inflation': (2.5, 1.0),
+    'renewal_rate': (0.85, 0.05),
+    'turnover_months': 1.0,  # rent lost on each unit that does not renew, beyond the expected rate
+}
+POOL_THRESHOLD = 200_000
+CHUNK_PATHS = 100_000
+
+def _simulate_chunk(data, n_paths, years, seed, assumptions):
+    a = assumptions; rng = np.random.default_rng(seed); shape = (n_paths, years)
+    # Year 1 is the underwritten year; draws compound from year 2 onwards
+    rent_g = rng.normal(a['rent_growth'][0], a['rent_growth'][1], shape) / 100; rent_g[:, 0] = 0
+    opex_g = rng.normal(a['expense_inflation'][0], a['expense_inflation'][1], shape) / 100; opex_g[:, 0] = 0
+    rent_idx = np.cumprod(1 + rent_g, axis=1); opex_idx = np.cumprod(1 + opex_g, axis=1)
+    vac = np.clip(rng.normal(data['vacancy'], a['vacancy_sd'], shape), 0, 100) / 100
+    renew = np.clip(rng.normal(a['renewal_rate'][0], a['renewal_rate'][1], shape), 0, 1)
+    # The underwritten vacancy already carries normal turnover; only the deviation from the
+    # expected renewal rate adds (or saves) rent loss, so the year-1 median stays on the underwriting
+    loss = np.clip(vac + (a['renewal_rate'][0] - renew) * a['turnover_months'] / 12, 0, 1)
+    egi = data['potential_inc'] * rent_idx * (1 - loss)
+    fixed_opex = data['ex_tax'] + data['ex_ins'] + data['ex_util'] + data['ex_rm'] + data['ex_res']
+    noi = egi * (1 - data['mgmt'] / 100) - fixed_opex * opex_idx
+    debt = data['annual_debt_svc']
+    dcr = noi / debt if debt > 0 else np.zeros_like(noi)
+    return noi.astype(np.float32), dcr.astype(np.float32), (noi - debt).astype(np.float32)
+
+def simulation_pool(workers=None):
+    # Spawned, not forked: the app reaches this from the Streamlit server's script thread.
+    # Long-lived callers keep one (the app caches it per process) so runs skip worker startup.
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=multiprocessing.get_context('spawn'))
+
+def simulate_pro_forma(data, n_paths=50_000, years=10, seed=None, assumptions=None, workers=None, pool=None):
+    # data: the pdf_data dict. Returns (paths x years) NOI, DCR and cash-flow arrays.
+    # Runs above POOL_THRESHOLD paths are split into independent seed streams and spread
+    # over `pool`, or over a pool built for this call when only workers is set (0 = one per CPU).
+    a = {**DEFAULT_ASSUMPTIONS, **(assumptions or {})}
+    base = {k: float(data[k]) for k in ('potential_inc', 'vacancy', 'mgmt', 'ex_tax', 'ex_ins', 'ex_util', 'ex_rm', 'ex_res', 'annual_debt_svc')}
+    if (pool is None and workers is None) or n_paths <= POOL_THRESHOLD:
+        noi, dcr, cf = _simulate_chunk(base, n_paths, years, seed, a)
+    else:
+        sizes = [CHUNK_PATHS] * (n_paths // CHUNK_PATHS) + ([n_paths % CHUNK_PATHS] if n_paths % CHUNK_PATHS else [])
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        args = ([base] * len(sizes), sizes, [years] * len(sizes), seeds, [a] * len(sizes))
+        if pool is not None: parts = list(pool.map(_simulate_chunk, *args))
+        else:
+            with simulation_pool(workers) as ex: parts = list(ex.map(_simulate_chunk, *args))
+        noi, dcr, cf = (np.concatenate(p) for p in zip(*parts))
+    return {'noi': noi, 'dcr': dcr, 'cash_flow': cf, 'n_paths': n_paths, 'years': years}
+
+def summarize_simulation(sim, pcts=(5, 50, 95), min_dcr=MIN_DCR):
+    out = {"Year": np.arange(1, sim['years'] + 1)}
+    for key, label in (('noi', 'NOI'), ('dcr', 'DCR'), ('cash_flow', 'Cash Flow')):
+        for p, band in zip(pcts, np.percentile(sim[key], pcts, axis=0)): out[f"{label} P{p}"] = band
+    below = sim['dcr'] < min_dcr
+    out[f"P(DCR < {min_dcr:.2f}x)"] = below.mean(axis=0)
+    return pd.DataFrame(out), float(below.any(axis=1).mean())
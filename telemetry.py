@@ -0,0 +1,174 @@
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ==========================================
+# RERUN TIMING, METRICS EXPORT & SAMPLING PROFILER
+# ==========================================
+# Named spans are aggregated per session and per process. The process registry renders
+# Prometheus text format, written to METRICS_FILE (textfile collector) and optionally
+# served on MLI_METRICS_PORT; every rerun also emits one JSON log line.
+# The sign-in form checks no credentials, so admin tools need a real secret: a user listed
+# in MLI_ADMINS who signs in with MLI_ADMIN_TOKEN as the password. Without a token set,
+# nobody is an admin.
+METRICS_FILE = os.environ.get("MLI_METRICS_FILE", os.path.join(".cache", "metrics", "mli.prom"))
+METRICS_PORT = int(os.environ.get("MLI_METRICS_PORT", 0))
+METRICS_HOST = os.environ.get("MLI_METRICS_HOST", "127.0.0.1")  # unauthenticated; keep it off public interfaces
+METRICS_FLUSH_SECS = 5.0
+ADMINS = {u.strip() for u in os.environ.get("MLI_ADMINS", "").split(",") if u.strip()}
+ADMIN_TOKEN = os.environ.get("MLI_ADMIN_TOKEN", "")
+SESSION_TTL_SECS = 15 * 60  # a session counts as active this long after its last rerun
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNIT_BUCKETS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+PROFILE_INTERVAL = 0.005
+
+log = logging.getLogger("mli.telemetry")
+if not log.handlers:
+    _h = logging.StreamHandler(sys.stderr); _h.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(_h); log.setLevel(logging.INFO); log.propagate = False
+
+def is_admin(username, token):
+    # Constant-time token check; the username alone grants nothing
+    if not (ADMIN_TOKEN and username and username in ADMINS and token): return False
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets; self.counts = [0] * (len(buckets) + 1); self.sum = 0.0; self.count = 0; self.max = 0.0
+
+    def observe(self, v):
+        i = next((i for i, b in enumerate(self.buckets) if v <= b), len(self.buckets))
+        self.counts[i] += 1; self.sum += v; self.count += 1; self.max = max(self.max, v)
+
+    def prometheus(self, name, labels=""):
+        sep = "," if labels else ""; out = []; cum = 0
+        for b, c in zip(self.buckets + ("+Inf",), self.counts):
+            cum += c; out.append(f'{name}_bucket{{{labels}{sep}le="{b}"}} {cum}')
+        lbl = f"{{{labels}}}" if labels else ""
+        return out + [f"{name}_sum{lbl} {self.sum:.6f}", f"{name}_count{lbl} {self.count}"]
+
+class SpanStats:
+    # Thread-safe span aggregate; one per session and one for the whole process
+    def __init__(self):
+        self.spans = {}; self.reruns = Histogram(SPAN_BUCKETS); self.units = Histogram(UNIT_BUCKETS); self.sessions = {}; self._lock = threading.Lock()
+
+    def observe(self, name, secs):
+        with self._lock: self.spans.setdefault(name, Histogram(SPAN_BUCKETS)).observe(secs)
+
+    def observe_rerun(self, secs, session_id=None, units=None):
+        with self._lock:
+            self.reruns.observe(secs)
+            if units: self.units.observe(units)
+            if session_id: self.sessions[session_id] = time.time()
+
+    def table(self):
+        # Per-span summary rows for display
+        with self._lock:
+            return [{'Span': k, 'Count': h.count, 'Total (ms)': h.sum * 1000, 'Mean (ms)': h.sum / h.count * 1000 if h.count else 0.0, 'Max (ms)': h.max * 1000}
+                    for k, h in sorted(self.spans.items(), key=lambda kv: -kv[1].sum)]
+
+    def render(self):
+        with self._lock:
+            now = time.time(); self.sessions = {s: t for s, t in self.sessions.items() if now - t < SESSION_TTL_SECS}
+            lines = ["# HELP mli_span_seconds Time spent in named app spans.", "# TYPE mli_span_seconds histogram"]
+            for name, h in sorted(self.spans.items()): lines += h.prometheus("mli_span_seconds", f'span="{name}"')
+            lines += ["# HELP mli_rerun_seconds Wall time of full script reruns.", "# TYPE mli_rerun_seconds histogram"] + self.reruns.prometheus("mli_rerun_seconds")
+            lines += ["# HELP mli_rent_roll_units Residential units in the rent roll at each rerun.", "# TYPE mli_rent_roll_units histogram"] + self.units.prometheus("mli_rent_roll_units")
+            lines += ["# HELP mli_active_sessions Sessions that reran in the last 15 minutes.", "# TYPE mli_active_sessions gauge", f"mli_active_sessions {len(self.sessions)}"]
+        return "\n".join(lines) + "\n"
+
+PROCESS = SpanStats()
+_flush = {'t': 0.0}; _flush_lock = threading.Lock()
+
+def write_metrics(path=METRICS_FILE, force=False):
+    # Atomic rewrite, throttled so busy servers do not rewrite the file on every rerun
+    with _flush_lock:
+        if not force and time.monotonic() - _flush['t'] < METRICS_FLUSH_SECS: return False
+        _flush['t'] = time.monotonic()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f: f.write(PROCESS.render())
+    os.replace(tmp, path)
+    return True
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics": self.send_error(404); return
+        body = PROCESS.render().encode()
+        self.send_response(200); self.send_header("Content-Type", "text/plain; version=0.0.4"); self.send_header("Content-Length", str(len(body))); self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args): pass
+
+def serve_metrics(port=METRICS_PORT, host=METRICS_HOST):
+    # Background /metrics endpoint for this process; returns None when no port is configured
+    if not port: return None
+    srv = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=srv.serve_forever, name="mli-metrics", daemon=True).start()
+    return srv
+
+class Rerun:
+    # Spans of one script run. Each span is recorded in the session and process aggregates
+    # as soon as it closes, so fragment reruns are counted too.
+    def __init__(self, session, session_id=None, user=None):
+        self.session = session; self.session_id = session_id; self.user = user; self.spans = []; self.attrs = {}; self.t0 = time.perf_counter()
+
+    @contextmanager
+    def span(self, name):
+        t = time.perf_counter()
+        try: yield
+        finally:
+            dt = time.perf_counter() - t; self.spans.append((name, dt)); self.session.observe(name, dt); PROCESS.observe(name, dt)
+
+    def finish(self):
+        total = time.perf_counter() - self.t0; units = self.attrs.get('units')
+        self.session.observe_rerun(total, self.session_id, units); PROCESS.observe_rerun(total, self.session_id, units)
+        spans = {}
+        for name, dt in self.spans: spans[name] = round(spans.get(name, 0) + dt * 1000, 2)
+        log.info(json.dumps({'event': 'rerun', 'ts': time.strftime('%Y-%m-%dT%H:%M:%S'), 'session': (self.session_id or '')[:8], 'user': self.user,
+                             'total_ms': round(total * 1000, 2), **self.attrs, 'spans': spans}, default=str))
+        try: write_metrics()
+        except OSError as e: log.warning(f"metrics file not written: {e}")
+        return total
+
+class Sampler:
+    # Stdlib sampling profiler for one thread: a background thread snapshots the target's
+    # stack every `interval` seconds via sys._current_frames()
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident(); self.interval = interval
+        self.stacks = Counter(); self.samples = 0; self._stop = threading.Event(); self._thread = None; self.seconds = 0.0
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None: continue
+            stack = []
+            while frame is not None:
+                c = frame.f_code; stack.append(f"{c.co_name} ({os.path.basename(c.co_filename)}:{frame.f_lineno})"); frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1; self.samples += 1
+
+    def start(self):
+        self._t0 = time.perf_counter(); self._thread = threading.Thread(target=self._run, name="mli-sampler", daemon=True); self._thread.start(); return self
+
+    def stop(self):
+        self._stop.set(); self._thread.join(); self.seconds = time.perf_counter() - self._t0; return self
+
+    def top(self, n=25):
+        # Self and inclusive sample share per function (line numbers dropped)
+        own, incl = Counter(), Counter()
+        for stack, c in self.stacks.items():
+            funcs = [f.rsplit(':', 1)[0] + ")" for f in stack]; own[funcs[-1]] += c
+            for f in set(funcs): incl[f] += c
+        total = max(self.samples, 1)
+        return [{'Function': f, 'Self %': own[f] / total * 100, 'Total %': incl[f] / total * 100, 'Samples': own[f]} for f, _ in own.most_common(n)]
+
+    def folded(self):
+        # Collapsed stacks ("a;b;c count") for flamegraph.pl / speedscope
+        return "\n".join(f"{';'.join(s)} {c}" for s, c in self.stacks.most_common()) + "\n"
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from cashflow import amortization_schedule
+from goal_seek import break_even_rate, max_supportable_cost, solve
+from underwriting import MIN_DCR, calculate_pmt, underwrite
+
+# Pins the sizing, schedule and goal-seek identities the reports depend on.
+# Run from the repo root: python -m pytest -q
+
+def test_dcr_limited_loan_sizes_to_min_dcr():
+    u = underwrite({'cost_base': 50_000_000, 'noi': 1_200_000, 'interest_rate': 4.5, 'score': 100})
+    assert u['loan_dcr'] < u['loan_ltv']
+    assert u['dcr_actual'] == pytest.approx(MIN_DCR, abs=1e-9)
+
+def test_renewal_schedule_matches_monthly_loop():
+    principal, rate, amort, term, renewals = 1_000_000, 4.0, 25, 5, [5.5, 3.0]
+    s = amortization_schedule(principal, rate, amort, term_years=term, renewal_rates=renewals)
+    bal = principal; rows = []
+    for m in range(amort * 12):
+        if m % (term * 12) == 0:
+            j = m // (term * 12)
+            r_ann = rate if j == 0 else renewals[min(j - 1, len(renewals) - 1)]
+            pmt = calculate_pmt(bal, r_ann, (amort * 12 - m) / 12)
+        interest = bal * r_ann / 100 / 12; bal = max(bal + interest - pmt, 0)
+        rows.append((r_ann, interest, pmt, bal))
+    r_ann, interest, pmt, bal = map(np.array, zip(*rows))
+    np.testing.assert_allclose(s['rate'], r_ann)
+    np.testing.assert_allclose(s['interest'], interest, atol=1e-6)
+    np.testing.assert_allclose(s['payment'], pmt, atol=1e-6)
+    np.testing.assert_allclose(s['balance'], bal, atol=1e-4)
+    assert s['balance'][-1] == pytest.approx(0, abs=1e-4)
+
+def test_break_even_rate_holds_target_dcr():
+    noi, loan, amort = 900_000, 14_000_000, 40
+    rate = break_even_rate(noi, loan, amort, target_dcr=MIN_DCR)
+    assert 0 < rate < 30
+    assert noi / (calculate_pmt(loan, rate, amort) * 12) == pytest.approx(MIN_DCR, rel=1e-9)
+
+def test_max_supportable_cost_meets_both_limits():
+    noi, rate, amort, ltv = 1_200_000, 4.5, 50, 0.95
+    cost = max_supportable_cost(noi, rate, amort, ltv)
+    u = underwrite({'cost_base': cost, 'noi': noi, 'interest_rate': rate, 'score': 0, 'ltv': ltv, 'amort': amort})
+    assert u['loan_ltv'] == pytest.approx(u['loan_dcr'], rel=1e-9)
+
+@pytest.mark.parametrize('equity', [500_000, 5_000_000])
+def test_max_cost_equity_uses_the_whole_budget(equity):
+    deal = {'noi': 1_200_000, 'cost_base': 20_000_000, 'interest_rate': 4.5, 'score': 100}
+    cost = solve(deal, equity_budget=equity)['max_cost_equity']
+    u = underwrite(dict(deal, cost_base=cost))
+    assert u['equity'] == pytest.approx(equity, rel=1e-9)
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# MLI SELECT UNDERWRITING ENGINE
+# ==========================================
+# Every function takes scalars or NumPy arrays and broadcasts, so the same code
+# sizes one deal in the UI or thousands of acquisition candidates in one pass.
+MIN_DCR = 1.10
+NON_RES_PATTERN = 'Parking|Retail'
+
+# Affordable-unit share (%) -> affordability points
+AFF_TIERS = [(25, 100), (15, 70), (10, 50)]
+# Total score -> CMHC premium (% of loan)
+FEE_TIERS = [(100, 1.25), (70, 2.25), (50, 3.00)]
+BASE_FEE = 4.00
+# Total score -> (max LTV, amortization years)
+REWARD_TIERS = [(100, 0.95, 50), (50, 0.95, 40)]
+BASE_REWARDS = (0.75, 25)
+
+def _out(x):
+    # 0-d results come back as NumPy scalars so they format like floats
+    x = np.asarray(x)
+    return x[()] if x.ndim == 0 else x
+
+def calculate_cmhc_fee(loan, pts):
+    # CMHC Fee Scale
+    pts = np.asarray(pts)
+    rate = np.select([pts >= t for t, _ in FEE_TIERS], [r for _, r in FEE_TIERS], BASE_FEE)
+    return _out(np.asarray(loan, dtype=float) * (rate / 100)), _out(rate)
+
+def calculate_pmt(principal, annual_rate, years):
+    principal = np.asarray(principal, dtype=float)
+    r = np.asarray(annual_rate, dtype=float) / 100 / 12; n = np.asarray(years, dtype=float) * 12
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = (1 + r)**n
+        pmt = np.where(r == 0, principal / n, principal * (r * growth) / (growth - 1))
+    return _out(pmt)
+
+def annuity_factor(annual_rate, years):
+    # Present value of 1/month paid for the amortization period
+    r = np.asarray(annual_rate, dtype=float) / 100 / 12; n = np.asarray(years, dtype=float) * 12
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _out(np.where(r == 0, n, (1 - (1 + r)**(-n)) / np.where(r == 0, 1, r)))
+
+def affordability_points(aff_pct):
+    aff_pct = np.asarray(aff_pct, dtype=float)
+    return _out(np.select([aff_pct >= t for t, _ in AFF_TIERS], [p for _, p in AFF_TIERS], 0))
+
+def score_rewards(score):
+    score = np.asarray(score)
+    conds = [score >= t for t, _, _ in REWARD_TIERS]
+    ltv = np.select(conds, [l for _, l, _ in REWARD_TIERS], BASE_REWARDS[0])
+    amort = np.select(conds, [a for _, _, a in REWARD_TIERS], BASE_REWARDS[1])
+    return _out(ltv), _out(amort)
+
+def residential_mask(unit_types):
+    return ~pd.Series(unit_types, dtype=object).astype(str).str.contains(NON_RES_PATTERN, case=False).to_numpy()
+
+def rent_roll_metrics(unit_types, counts, rents, rent_cap):
+    # rent_cap may be an array of caps (one per market); result broadcasts over it
+    res = residential_mask(unit_types)
+    # A blank rent (e.g. a vacant suite) still counts as a unit but is never affordable
+    counts = np.nan_to_num(np.asarray(counts, dtype=float)); rents = np.asarray(rents, dtype=float)
+    caps = np.asarray(rent_cap, dtype=float)[..., None]
+    res_counts = np.where(res, counts, 0)
+    aff_count = (res_counts * (rents <= caps)).sum(axis=-1)
+    total_res = res_counts.sum()
+    aff_pct = np.where(total_res > 0, aff_count / max(total_res, 1) * 100, 0)
+    gross = (counts * np.nan_to_num(rents)).sum()
+    return {'aff_count': _out(aff_count), 'total_res': _out(total_res), 'aff_pct': _out(aff_pct),
+            'pts_aff': affordability_points(aff_pct), 'gross': _out(gross), 'potential_inc': _out(gross * 12)}
+
+def operating_income(potential_inc, vacancy, mgmt, tax, ins, util, rm, reserves):
+    egi = np.asarray(potential_inc, dtype=float) * (1 - np.asarray(vacancy, dtype=float) / 100)
+    mgmt_amt = egi * (np.asarray(mgmt, dtype=float) / 100)
+    total_opex = np.asarray(tax, dtype=float) + ins + util + rm + reserves + mgmt_amt
+    return {'egi': _out(egi), 'mgmt_amt': _out(mgmt_amt), 'total_opex': _out(total_opex), 'noi': _out(egi - total_opex)}
+
+def size_loan(cost_base, noi, interest_rate, amort, ltv):
+    # Lesser of the LTV limit and the loan whose payment holds DCR at MIN_DCR
+    loan_ltv = np.asarray(cost_base, dtype=float) * ltv
+    loan_dcr = np.maximum(np.asarray(noi, dtype=float) / MIN_DCR / 12, 0) * annuity_factor(interest_rate, amort)
+    return _out(loan_ltv), _out(loan_dcr), _out(np.minimum(loan_ltv, loan_dcr))
+
+NOI_COMPONENTS = ['potential_inc', 'vacancy', 'mgmt', 'ex_tax', 'ex_ins', 'ex_util', 'ex_rm', 'ex_res']
+
+def underwrite(deals):
+    # deals: DataFrame or mapping with cost_base, interest_rate, score and either noi or
+    # the NOI_COMPONENTS; amort/ltv default to the MLI Select rewards for the score.
+    # Returns a DataFrame for DataFrame input, otherwise a dict of arrays/scalars.
+    col = lambda k: np.asarray(deals[k], dtype=float)
+    has = lambda k: k in (deals.columns if isinstance(deals, pd.DataFrame) else deals)
+    out = {}
+    if has('noi'): noi = col('noi')
+    else:
+        out.update(operating_income(*[col(k) for k in NOI_COMPONENTS])); noi = np.asarray(out['noi'])
+    cost_base = col('cost_base'); rate = col('interest_rate'); score = col('score')
+    ltv, amort = score_rewards(score)
+    if has('ltv'): ltv = col('ltv')
+    if has('amort'): amort = col('amort')
+    loan_ltv, loan_dcr, approved = size_loan(cost_base, noi, rate, amort, ltv)
+    fee, fee_rate = calculate_cmhc_fee(approved, score)
+    debt_svc = np.asarray(calculate_pmt(approved, rate, amort)) * 12
+    equity = cost_base - approved
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dcr = np.where(debt_svc > 0, noi / debt_svc, 0)
+        coc = np.where(equity > 0, (noi - debt_svc) / equity * 100, 0)
+        cap_rate = np.where(cost_base > 0, noi / cost_base * 100, 0)
+        ltc = np.where(cost_base > 0, approved / cost_base * 100, 0)
+    out.update({'noi': noi, 'ltv': ltv, 'amort': amort, 'loan_ltv': loan_ltv, 'loan_dcr': loan_dcr, 'approved': approved,
+                'fee': fee, 'fee_rate': fee_rate, 'approved_loan': np.asarray(approved) + fee, 'equity': equity,
+                'annual_debt_svc': debt_svc, 'dcr_actual': dcr, 'coc_return': coc, 'cap_rate': cap_rate, 'ltc': ltc})
+    if isinstance(deals, pd.DataFrame):
+        return pd.DataFrame({k: np.broadcast_to(v, len(deals)) for k, v in out.items()}, index=deals.index)
+    shape = np.broadcast_shapes(*[np.shape(v) for v in out.values()])
+    return {k: _out(np.broadcast_to(v, shape)) for k, v in out.items()}